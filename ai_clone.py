@@ -1,4 +1,4 @@
-from db import connect, is_postgres
+from db import connect, is_postgres, bump_versions
 
 def generate_ai_clone(intern_id: str, note: str, supervisor_name: str = "Samip Gajurel", rating: int | None = None):
     conn = connect()
@@ -97,6 +97,7 @@ def generate_ai_clone(intern_id: str, note: str, supervisor_name: str = "Samip G
         """,
         (intern_id, supervisor_name, note, rating)
     )
+    bump_versions(cur, "supervisor_feedback")
 
     conn.commit()
     conn.close()
@@ -1,31 +1,59 @@
 import os, io, csv, shutil
 from typing import Optional
-from fastapi import FastAPI, UploadFile, File, HTTPException, Depends
+from fastapi import FastAPI, UploadFile, File, HTTPException, Depends, Request
+from fastapi.responses import StreamingResponse, PlainTextResponse
 from fastapi.middleware.cors import CORSMiddleware
+from starlette.concurrency import run_in_threadpool
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from pydantic import BaseModel
 
-from db import init_db, connect, is_postgres, row_to_dict, ph
+from db import init_db, connect, is_postgres, row_to_dict, ph, bump_versions, pin_primary, replica_status
 from auth import verify_password, create_token, decode_token, hash_password
-from ingest import run_ingest
 from mailer import send_email, email_enabled
+from events import hub, sse_stream
+from search import search, SEARCH_KINDS
+from cache import conditional_json, ReadFloorMiddleware
+from jobs import start_periodic
+from rollups import ROLLUP_INTERVAL_SEC, refresh_rollups, feedback_trend, tasks_trend, time_to_done
+from retention import (RETENTION_DAYS, RETENTION_INTERVAL_SEC, RAG_COMPACT,
+                       archive_task_updates, compact_rag_records, run_retention)
+from limits import BulkheadMiddleware, limits_stats
+from profiling import ProfilingMiddleware, get_profile, list_profiles
+from export import EXPORT_FORMATS, stream_csv, stream_ndjson, stream_parquet, parquet_available
+from reminders import scheduler as reminders
 
 app = FastAPI(title="AI Clone Intern System")
 
+# read-your-writes across workers when a read replica is configured, see cache.py
+app.add_middleware(ReadFloorMiddleware)
+
+# opt-in admin profiling (X-Profile header / ?__profile=1), see profiling.py
+app.add_middleware(ProfilingMiddleware)
+
+# admission control per route class (heavy/auth/read), see limits.py
+app.add_middleware(BulkheadMiddleware)
+
 # CORS (so frontend can call backend)
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],  # for testing; later restrict to your frontend domain
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Read-Floor"],
 )
 
 bearer = HTTPBearer(auto_error=True)
 
 @app.on_event("startup")
 def startup():
-    init_db()
-    ensure_default_admin()
+    # under gunicorn the master already ran this once (gunicorn.conf.py:on_starting)
+    if os.getenv("APP_INIT_DONE") != "1":
+        init_db()
+        ensure_default_admin()
+    hub.start_relay()
+    start_periodic("retention", RETENTION_INTERVAL_SEC, run_retention)
+    start_periodic("rollups", ROLLUP_INTERVAL_SEC, refresh_rollups)
+    reminders.start()
 
 def ensure_default_admin():
     admin_user = os.getenv("ADMIN_USER", "admin")
@@ -42,16 +70,18 @@ def ensure_default_admin():
             cur.execute("""
               INSERT INTO users(username, full_name, role, password_hash)
               VALUES (%s,%s,'admin',%s)
+              ON CONFLICT(username) DO NOTHING
             """, (admin_user, "System Admin", hash_password(admin_pass)))
         else:
             cur.execute("""
               INSERT INTO users(username, full_name, role, password_hash, created_at)
               VALUES (?,?,?,?,datetime('now'))
+              ON CONFLICT(username) DO NOTHING
             """, (admin_user, "System Admin", "admin", hash_password(admin_pass)))
         conn.commit()
     conn.close()
 
-def get_current_user(creds: HTTPAuthorizationCredentials = Depends(bearer)):
+def get_current_user(request: Request, creds: HTTPAuthorizationCredentials = Depends(bearer)):
     payload = decode_token(creds.credentials)
     if not payload:
         raise HTTPException(401, "Invalid token")
@@ -69,6 +99,9 @@ def get_current_user(creds: HTTPAuthorizationCredentials = Depends(bearer)):
     u = row_to_dict(u)
     if not u.get("active"):
         raise HTTPException(403, "Account disabled")
+    if request.method not in ("GET", "HEAD"):
+        # this user's next reads must see the write: keep them off the replica
+        pin_primary(u["id"])
     return u
 
 def require_role(*roles):
@@ -159,6 +192,7 @@ def create_supervisor(body: CreateSupervisorIn, admin=Depends(require_role("admi
           VALUES (?,?,?,?,datetime('now'))
         """, (body.username, body.full_name, "supervisor", hash_password(body.password)))
 
+    bump_versions(cur, "users")
     conn.commit()
     conn.close()
     return {"message":"Supervisor created"}
@@ -170,7 +204,10 @@ async def upload_dataset(file: UploadFile = File(...), admin=Depends(require_rol
     with open(path, "wb") as f:
         shutil.copyfileobj(file.file, f)
 
-    n, creds = run_ingest(path)
+    # imported here: ingest pulls in pandas/NumPy, which only this route needs
+    from ingest import run_ingest
+    # pandas + PBKDF2 per row: keep it off the event loop
+    n, creds = await run_in_threadpool(run_ingest, path)
 
     # credentials CSV (copy once & store safely)
     output = io.StringIO()
@@ -205,7 +242,7 @@ Thanks,
 Internship Admin
 """.strip()
             try:
-                send_email(to_email, subject, body)
+                await run_in_threadpool(send_email, to_email, subject, body)
                 sent += 1
             except Exception as e:
                 failed.append({"email": to_email, "error": str(e)})
@@ -218,31 +255,200 @@ Internship Admin
         "emails_failed": failed[:10]
     }
 
+@app.post("/admin/retention/run")
+def retention_run(older_than_days: Optional[int] = None, admin=Depends(require_role("admin"))):
+    days = older_than_days if older_than_days is not None else RETENTION_DAYS
+    if days < 1:
+        raise HTTPException(400, "older_than_days must be >= 1")
+
+    out = {"older_than_days": days, "task_updates_archived": archive_task_updates(days)}
+    if RAG_COMPACT:
+        out["rag_records_compacted"] = compact_rag_records(days)
+    return out
+
+@app.post("/admin/rollups/refresh")
+def rollups_refresh(admin=Depends(require_role("admin"))):
+    return refresh_rollups()
+
+@app.get("/admin/limits")
+def admission_stats(admin=Depends(require_role("admin"))):
+    return limits_stats()
+
+@app.get("/admin/db/replica")
+def replica_stats(admin=Depends(require_role("admin"))):
+    return replica_status()
+
+@app.get("/admin/reminders")
+def reminder_stats(admin=Depends(require_role("admin"))):
+    return reminders.stats()
+
+@app.get("/admin/profiles")
+def profiles(admin=Depends(require_role("admin"))):
+    return list_profiles()
+
+@app.get("/admin/profiles/{profile_id}")
+def profile_detail(profile_id: str, format: str = "summary", admin=Depends(require_role("admin"))):
+    session = get_profile(profile_id)
+    if not session:
+        raise HTTPException(404, "Profile not found")
+
+    fmt = format.strip().lower()
+    if fmt == "summary":
+        return session.summary()
+    if fmt == "speedscope":
+        return session.speedscope()
+    if fmt == "collapsed":
+        return PlainTextResponse(session.collapsed())
+    raise HTTPException(400, "format must be summary|speedscope|collapsed")
+
+@app.get("/admin/export")
+def export_interns(format: str = "csv", admin=Depends(require_role("admin"))):
+    fmt = format.strip().lower()
+    if fmt not in EXPORT_FORMATS:
+        raise HTTPException(400, "format must be csv|ndjson|parquet")
+    if fmt == "parquet" and not parquet_available():
+        raise HTTPException(400, "parquet export needs pyarrow installed")
+
+    streams = {
+        "csv": (stream_csv, "text/csv"),
+        "ndjson": (stream_ndjson, "application/x-ndjson"),
+        "parquet": (stream_parquet, "application/vnd.apache.parquet"),
+    }
+    gen, media_type = streams[fmt]
+    return StreamingResponse(
+        gen(uid=admin["id"]),
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="interns_export.{fmt}"'},
+    )
+
 # ---------- Interns ----------
 @app.get("/interns")
-def list_interns(u=Depends(require_role("admin","supervisor","intern"))):
-    conn = connect()
-    cur = conn.cursor()
-    cur.execute("""
-      SELECT id_info, name, email, working_on_project, progress_rating_num, status
-      FROM interns
-      ORDER BY id_info
-    """)
-    rows = cur.fetchall()
-    conn.close()
-    return [row_to_dict(r) for r in rows]
+def list_interns(request: Request, u=Depends(require_role("admin","supervisor","intern"))):
+    def build():
+        conn = connect(readonly=True, uid=u["id"])
+        cur = conn.cursor()
+        cur.execute("""
+          SELECT id_info, name, email, working_on_project, progress_rating_num, status
+          FROM interns
+          ORDER BY id_info
+        """)
+        rows = cur.fetchall()
+        conn.close()
+        return [row_to_dict(r) for r in rows]
+
+    return conditional_json(request, ("interns",), "all", build)
 
 @app.get("/interns/{intern_id}")
-def intern_detail(intern_id: str, u=Depends(require_role("admin","supervisor","intern"))):
-    conn = connect()
-    cur = conn.cursor()
-    p = ph()
-    cur.execute(f"SELECT * FROM interns WHERE id_info={p}", (intern_id,))
-    r = cur.fetchone()
-    conn.close()
-    if not r:
-        raise HTTPException(404, "Intern not found")
-    return row_to_dict(r)
+def intern_detail(request: Request, intern_id: str, u=Depends(require_role("admin","supervisor","intern"))):
+    def build():
+        conn = connect(readonly=True, uid=u["id"])
+        cur = conn.cursor()
+        p = ph()
+        cur.execute(f"SELECT * FROM interns WHERE id_info={p}", (intern_id,))
+        r = cur.fetchone()
+        conn.close()
+        if not r:
+            raise HTTPException(404, "Intern not found")
+        return row_to_dict(r)
+
+    return conditional_json(request, ("interns",), "all", build)
+
+@app.get("/interns/{intern_id}/dashboard")
+def intern_dashboard(request: Request, intern_id: str, updates_per_task: int = 5,
+                     u=Depends(require_role("admin","supervisor","intern"))):
+    """
+    Everything an intern page needs in one call, built from 4 set-based
+    queries (no per-task loop): intern + account, tasks with update counts,
+    latest N updates per task, feedback history.
+    """
+    # interns only see their own dashboard
+    if u["role"] == "intern" and u.get("intern_id_info") != intern_id:
+        raise HTTPException(403, "Not your dashboard")
+    updates_per_task = max(0, min(updates_per_task, 50))
+
+    def build():
+        conn = connect(readonly=True, uid=u["id"])
+        cur = conn.cursor()
+        p = ph()
+
+        cur.execute(f"""
+          SELECT i.*, us.id AS user_id, us.username
+          FROM interns i
+          LEFT JOIN users us ON us.intern_id_info = i.id_info AND us.role = 'intern'
+          WHERE i.id_info={p}
+          ORDER BY us.id
+          LIMIT 1
+        """, (intern_id,))
+        intern = row_to_dict(cur.fetchone())
+        if not intern:
+            conn.close()
+            raise HTTPException(404, "Intern not found")
+        intern = dict(intern)
+        user_id = intern.pop("user_id")
+        username = intern.pop("username")
+
+        tasks, latest = [], []
+        if user_id is not None:
+            cur.execute(f"""
+              SELECT t.id, t.title, t.description, t.status, t.due_date, t.assigned_by_user_id, t.created_at,
+                     COUNT(tu.id) AS update_count, MAX(tu.created_at) AS last_update_at
+              FROM tasks t
+              LEFT JOIN task_updates tu ON tu.task_id = t.id
+              WHERE t.assigned_to_user_id={p}
+              GROUP BY t.id
+              ORDER BY t.id DESC
+            """, (user_id,))
+            tasks = [dict(row_to_dict(r)) for r in cur.fetchall()]
+
+            if tasks and updates_per_task:
+                cur.execute(f"""
+                  SELECT id, task_id, intern_user_id, message, created_at
+                  FROM (
+                    SELECT tu.id, tu.task_id, tu.intern_user_id, tu.message, tu.created_at,
+                           ROW_NUMBER() OVER (PARTITION BY tu.task_id ORDER BY tu.id DESC) AS rn
+                    FROM task_updates tu
+                    JOIN tasks t ON t.id = tu.task_id
+                    WHERE t.assigned_to_user_id={p}
+                  ) x
+                  WHERE rn <= {p}
+                  ORDER BY task_id, id DESC
+                """, (user_id, updates_per_task))
+                latest = [row_to_dict(r) for r in cur.fetchall()]
+
+        cur.execute(f"""
+          SELECT id, supervisor_name, note, rating, created_at
+          FROM supervisor_feedback
+          WHERE intern_id_info={p}
+          ORDER BY id DESC
+        """, (intern_id,))
+        feedback = [row_to_dict(r) for r in cur.fetchall()]
+        conn.close()
+
+        by_task = {}
+        for upd in latest:
+            by_task.setdefault(upd["task_id"], []).append(upd)
+
+        status_counts = {"todo": 0, "in_progress": 0, "done": 0}
+        for t in tasks:
+            t["update_count"] = int(t["update_count"] or 0)
+            t["latest_updates"] = by_task.get(t["id"], [])
+            status_counts[t["status"]] = status_counts.get(t["status"], 0) + 1
+
+        return {
+            "intern": intern,
+            "user": {"id": user_id, "username": username} if user_id is not None else None,
+            "tasks": tasks,
+            "feedback": feedback,
+            "counters": {
+                "total_tasks": len(tasks),
+                "task_status": status_counts,
+                "total_updates": sum(t["update_count"] for t in tasks),
+                "feedback_count": len(feedback),
+            },
+        }
+
+    tables = ("interns", "users", "tasks", "task_updates", "supervisor_feedback")
+    return conditional_json(request, tables, "all", build)
 
 @app.put("/interns/{intern_id}/status")
 def update_intern_status(intern_id: str, body: StatusUpdate, u=Depends(require_role("admin","supervisor"))):
@@ -258,6 +464,7 @@ def update_intern_status(intern_id: str, body: StatusUpdate, u=Depends(require_r
     if getattr(cur, "rowcount", 0) == 0:
         conn.close()
         raise HTTPException(404, "Intern not found")
+    bump_versions(cur, "interns")
     conn.commit()
     conn.close()
     return {"message": f"Status updated to {status}"}
@@ -283,36 +490,47 @@ def create_task(body: TaskCreateIn, u=Depends(require_role("admin","supervisor")
     if is_postgres():
         cur.execute("""
           INSERT INTO tasks(title, description, due_date, assigned_to_user_id, assigned_by_user_id)
-          VALUES (%s,%s,%s,%s,%s)
+          VALUES (%s,%s,%s,%s,%s) RETURNING id
         """, (body.title, body.description, body.due_date, intern_user_id, u["id"]))
+        task_id = cur.fetchone()["id"]
     else:
         cur.execute("""
           INSERT INTO tasks(title, description, due_date, assigned_to_user_id, assigned_by_user_id, created_at)
           VALUES (?,?,?,?,?,datetime('now'))
         """, (body.title, body.description, body.due_date, intern_user_id, u["id"]))
+        task_id = cur.lastrowid
 
     # auto-activate intern if pending
     if intern_id_info:
         cur.execute(f"UPDATE interns SET status='active' WHERE id_info={p} AND status='pending'", (intern_id_info,))
 
+    bump_versions(cur, "tasks", "interns")
     conn.commit()
     conn.close()
+
+    hub.publish("task_created", {"task_id": task_id, "title": body.title, "status": "todo",
+                                 "due_date": body.due_date},
+                intern_user_id, u["id"])
+    reminders.notify(task_id, body.due_date)
     return {"message":"Task created"}
 
 @app.get("/tasks/my")
-def my_tasks(u=Depends(require_role("admin","supervisor","intern"))):
-    conn = connect()
-    cur = conn.cursor()
-    p = ph()
+def my_tasks(request: Request, u=Depends(require_role("admin","supervisor","intern"))):
+    def build():
+        conn = connect(readonly=True, uid=u["id"])
+        cur = conn.cursor()
+        p = ph()
+
+        if u["role"] == "intern":
+            cur.execute(f"SELECT * FROM tasks WHERE assigned_to_user_id={p} ORDER BY id DESC", (u["id"],))
+        else:
+            cur.execute(f"SELECT * FROM tasks WHERE assigned_by_user_id={p} ORDER BY id DESC", (u["id"],))
 
-    if u["role"] == "intern":
-        cur.execute(f"SELECT * FROM tasks WHERE assigned_to_user_id={p} ORDER BY id DESC", (u["id"],))
-    else:
-        cur.execute(f"SELECT * FROM tasks WHERE assigned_by_user_id={p} ORDER BY id DESC", (u["id"],))
+        rows = cur.fetchall()
+        conn.close()
+        return [row_to_dict(r) for r in rows]
 
-    rows = cur.fetchall()
-    conn.close()
-    return [row_to_dict(r) for r in rows]
+    return conditional_json(request, ("tasks",), (u["role"], u["id"]), build)
 
 @app.put("/tasks/{task_id}/status")
 def set_task_status(task_id: int, body: TaskSetStatusIn, u=Depends(require_role("admin","supervisor","intern"))):
@@ -325,14 +543,21 @@ def set_task_status(task_id: int, body: TaskSetStatusIn, u=Depends(require_role(
     cur = conn.cursor()
     p = ph()
 
+    cur.execute(f"SELECT assigned_to_user_id, assigned_by_user_id, status, due_date FROM tasks WHERE id={p}", (task_id,))
+    task = row_to_dict(cur.fetchone())
+
     # interns can only change own task
-    if u["role"] == "intern":
-        cur.execute(f"SELECT id FROM tasks WHERE id={p} AND assigned_to_user_id={p}", (task_id, u["id"]))
-        if not cur.fetchone():
-            conn.close()
-            raise HTTPException(403, "Not your task")
+    if u["role"] == "intern" and (not task or task["assigned_to_user_id"] != u["id"]):
+        conn.close()
+        raise HTTPException(403, "Not your task")
 
-    cur.execute(f"UPDATE tasks SET status={p} WHERE id={p}", (status, task_id))
+    # completed_at feeds the time-to-done rollups; keep the first completion time
+    now_sql = "NOW()" if is_postgres() else "datetime('now')"
+    cur.execute(f"""
+      UPDATE tasks SET status={p},
+        completed_at = CASE WHEN {p}='done' THEN COALESCE(completed_at, {now_sql}) ELSE NULL END
+      WHERE id={p}
+    """, (status, status, task_id))
 
     # if intern finished all tasks -> mark completed
     if u["role"] == "intern" and status == "done":
@@ -342,8 +567,16 @@ def set_task_status(task_id: int, body: TaskSetStatusIn, u=Depends(require_role(
         if rem == 0 and u.get("intern_id_info"):
             cur.execute(f"UPDATE interns SET status='completed' WHERE id_info={p}", (u["intern_id_info"],))
 
+    bump_versions(cur, "tasks", "interns")
     conn.commit()
     conn.close()
+
+    if task:
+        hub.publish("task_status", {"task_id": task_id, "status": status},
+                    task["assigned_to_user_id"], task["assigned_by_user_id"])
+        if task["status"] == "done" and status != "done":
+            # reopened: its reminders were dropped while it was done
+            reminders.notify(task_id, task["due_date"])
     return {"message": f"Task {task_id} status -> {status}"}
 
 @app.post("/tasks/{task_id}/update")
@@ -352,27 +585,57 @@ def task_update(task_id: int, body: TaskUpdateIn, u=Depends(require_role("intern
     cur = conn.cursor()
     p = ph()
 
-    cur.execute(f"SELECT id FROM tasks WHERE id={p} AND assigned_to_user_id={p}", (task_id, u["id"]))
-    if not cur.fetchone():
+    cur.execute(f"SELECT assigned_by_user_id, status, due_date FROM tasks WHERE id={p} AND assigned_to_user_id={p}", (task_id, u["id"]))
+    task = row_to_dict(cur.fetchone())
+    if not task:
         conn.close()
         raise HTTPException(403, "Not your task")
 
     if is_postgres():
-        cur.execute("INSERT INTO task_updates(task_id, intern_user_id, message) VALUES (%s,%s,%s)",
+        cur.execute("INSERT INTO task_updates(task_id, intern_user_id, message) VALUES (%s,%s,%s) RETURNING id, created_at",
                     (task_id, u["id"], body.message))
-        cur.execute("UPDATE tasks SET status='in_progress' WHERE id=%s", (task_id,))
+        upd = row_to_dict(cur.fetchone())
+        cur.execute("UPDATE tasks SET status='in_progress', completed_at=NULL WHERE id=%s", (task_id,))
     else:
         cur.execute("INSERT INTO task_updates(task_id, intern_user_id, message, created_at) VALUES (?,?,?,datetime('now'))",
                     (task_id, u["id"], body.message))
-        cur.execute("UPDATE tasks SET status='in_progress' WHERE id=?", (task_id,))
+        cur.execute("SELECT id, created_at FROM task_updates WHERE id=?", (cur.lastrowid,))
+        upd = row_to_dict(cur.fetchone())
+        cur.execute("UPDATE tasks SET status='in_progress', completed_at=NULL WHERE id=?", (task_id,))
 
+    bump_versions(cur, "task_updates", "tasks")
     conn.commit()
     conn.close()
+
+    hub.publish("task_update", {"task_id": task_id, "status": "in_progress",
+                                "update": {"id": upd["id"], "intern_user_id": u["id"],
+                                           "message": body.message, "created_at": upd["created_at"]}},
+                u["id"], task["assigned_by_user_id"])
+    if task["status"] == "done":
+        reminders.notify(task_id, task["due_date"])
     return {"message":"Update saved"}
 
+@app.get("/tasks/live")
+def live_feed(request: Request, since: Optional[int] = None, u=Depends(require_role("admin","supervisor","intern"))):
+    """
+    Server-Sent Events stream of task deltas (task_created, task_status, task_update).
+    Resume with ?since=<last event id> or the Last-Event-ID header; a `reset`
+    event means the cursor is too old and the client should re-read /tasks/my.
+    """
+    last_id = request.headers.get("last-event-id")
+    if since is None and last_id and last_id.isdigit():
+        since = int(last_id)
+
+    return StreamingResponse(
+        sse_stream(hub, u, since),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
 @app.get("/tasks/{task_id}/updates")
-def task_updates(task_id: int, u=Depends(require_role("admin","supervisor","intern"))):
-    conn = connect()
+def task_updates(task_id: int, include_archived: bool = False,
+                 u=Depends(require_role("admin","supervisor","intern"))):
+    conn = connect(readonly=True, uid=u["id"])
     cur = conn.cursor()
     p = ph()
 
@@ -384,80 +647,133 @@ def task_updates(task_id: int, u=Depends(require_role("admin","supervisor","inte
             raise HTTPException(403, "Not your task")
 
     cur.execute(f"SELECT * FROM task_updates WHERE task_id={p} ORDER BY id DESC", (task_id,))
-    rows = cur.fetchall()
+    rows = [row_to_dict(r) for r in cur.fetchall()]
+
+    # archived ids are always older than hot ones, so appending keeps id DESC order
+    if include_archived:
+        cur.execute(f"""
+          SELECT id, task_id, intern_user_id, message, created_at, archived_at
+          FROM task_updates_archive WHERE task_id={p} ORDER BY id DESC
+        """, (task_id,))
+        rows += [dict(row_to_dict(r), archived=True) for r in cur.fetchall()]
+
     conn.close()
-    return [row_to_dict(r) for r in rows]
+    return rows
+
+# ---------- Search ----------
+@app.get("/search")
+def search_all(q: str, kind: Optional[str] = None, limit: int = 20, offset: int = 0,
+               u=Depends(require_role("admin","supervisor","intern"))):
+    if kind and kind not in SEARCH_KINDS:
+        raise HTTPException(400, "kind must be interns|tasks|updates")
+    limit = max(1, min(limit, 100))
+    offset = max(0, offset)
+
+    kinds = (kind,) if kind else SEARCH_KINDS
+    return {"query": q, "limit": limit, "offset": offset, "hits": search(u, q, kinds, limit, offset)}
 
 # ---------- Analytics (Charts + Stats) ----------
 @app.get("/analytics/summary")
-def analytics_summary(u=Depends(require_role("admin","supervisor"))):
-    conn = connect()
-    cur = conn.cursor()
+def analytics_summary(request: Request, u=Depends(require_role("admin","supervisor"))):
+    def build():
+        conn = connect(readonly=True, uid=u["id"])
+        cur = conn.cursor()
 
-    cur.execute("SELECT COUNT(*) AS total FROM interns")
-    r = cur.fetchone()
-    total_interns = r["total"] if isinstance(r, dict) else r[0]
+        cur.execute("SELECT COUNT(*) AS total FROM interns")
+        r = cur.fetchone()
+        total_interns = r["total"] if isinstance(r, dict) else r[0]
 
-    cur.execute("SELECT status, COUNT(*) AS c FROM interns GROUP BY status")
-    rows = cur.fetchall()
-    status_counts = {rr["status"]: rr["c"] for rr in rows} if (rows and isinstance(rows[0], dict)) else {rr[0]: rr[1] for rr in rows}
+        cur.execute("SELECT status, COUNT(*) AS c FROM interns GROUP BY status")
+        rows = cur.fetchall()
+        status_counts = {rr["status"]: rr["c"] for rr in rows} if (rows and isinstance(rows[0], dict)) else {rr[0]: rr[1] for rr in rows}
 
-    cur.execute("SELECT AVG(progress_rating_num) AS avg_rating FROM interns")
-    ar = cur.fetchone()
-    avg_rating = ar["avg_rating"] if isinstance(ar, dict) else ar[0]
-    avg_rating = float(avg_rating or 0)
+        cur.execute("SELECT AVG(progress_rating_num) AS avg_rating FROM interns")
+        ar = cur.fetchone()
+        avg_rating = ar["avg_rating"] if isinstance(ar, dict) else ar[0]
+        avg_rating = float(avg_rating or 0)
 
-    cur.execute("SELECT COUNT(*) AS total_tasks FROM tasks")
-    tr = cur.fetchone()
-    total_tasks = tr["total_tasks"] if isinstance(tr, dict) else tr[0]
+        cur.execute("SELECT COUNT(*) AS total_tasks FROM tasks")
+        tr = cur.fetchone()
+        total_tasks = tr["total_tasks"] if isinstance(tr, dict) else tr[0]
 
-    cur.execute("SELECT status, COUNT(*) AS c FROM tasks GROUP BY status")
-    trows = cur.fetchall()
-    task_counts = {rr["status"]: rr["c"] for rr in trows} if (trows and isinstance(trows[0], dict)) else {rr[0]: rr[1] for rr in trows}
+        cur.execute("SELECT status, COUNT(*) AS c FROM tasks GROUP BY status")
+        trows = cur.fetchall()
+        task_counts = {rr["status"]: rr["c"] for rr in trows} if (trows and isinstance(trows[0], dict)) else {rr[0]: rr[1] for rr in trows}
 
-    conn.close()
-    return {
-        "total_interns": int(total_interns),
-        "status_counts": status_counts,
-        "avg_rating": round(avg_rating, 2),
-        "total_tasks": int(total_tasks),
-        "task_counts": task_counts
-    }
+        conn.close()
+        return {
+            "total_interns": int(total_interns),
+            "status_counts": status_counts,
+            "avg_rating": round(avg_rating, 2),
+            "total_tasks": int(total_tasks),
+            "task_counts": task_counts
+        }
+
+    return conditional_json(request, ("interns", "tasks"), "all", build)
 
 @app.get("/analytics/interns/ratings")
-def ratings_distribution(u=Depends(require_role("admin","supervisor"))):
-    conn = connect()
-    cur = conn.cursor()
+def ratings_distribution(request: Request, u=Depends(require_role("admin","supervisor"))):
+    def build():
+        conn = connect(readonly=True, uid=u["id"])
+        cur = conn.cursor()
 
-    cur.execute("""
-      SELECT CAST(progress_rating_num AS INT) AS r, COUNT(*) AS c
-      FROM interns
-      GROUP BY CAST(progress_rating_num AS INT)
-      ORDER BY r
-    """)
-    rows = cur.fetchall()
-    conn.close()
+        cur.execute("""
+          SELECT CAST(progress_rating_num AS INT) AS r, COUNT(*) AS c
+          FROM interns
+          GROUP BY CAST(progress_rating_num AS INT)
+          ORDER BY r
+        """)
+        rows = cur.fetchall()
+        conn.close()
 
-    out = []
-    for rr in rows:
-        if isinstance(rr, dict):
-            out.append({"rating": int(rr["r"]), "count": int(rr["c"])})
-        else:
-            out.append({"rating": int(rr[0]), "count": int(rr[1])})
-    return out
+        out = []
+        for rr in rows:
+            if isinstance(rr, dict):
+                out.append({"rating": int(rr["r"]), "count": int(rr["c"])})
+            else:
+                out.append({"rating": int(rr[0]), "count": int(rr[1])})
+        return out
+
+    return conditional_json(request, ("interns",), "all", build)
 
 @app.get("/analytics/tasks/status")
-def tasks_status(u=Depends(require_role("admin","supervisor"))):
-    conn = connect()
-    cur = conn.cursor()
-    cur.execute("SELECT status, COUNT(*) AS c FROM tasks GROUP BY status")
-    rows = cur.fetchall()
-    conn.close()
+def tasks_status(request: Request, u=Depends(require_role("admin","supervisor"))):
+    def build():
+        conn = connect(readonly=True, uid=u["id"])
+        cur = conn.cursor()
+        cur.execute("SELECT status, COUNT(*) AS c FROM tasks GROUP BY status")
+        rows = cur.fetchall()
+        conn.close()
 
-    out = []
-    for rr in rows:
-        if isinstance(rr, dict):
-            out.append({"status": rr["status"], "count": int(rr["c"])})
-        else:
-            out.append({"status": rr[0], "count": int(rr[1])})
-    return out
+        out = []
+        for rr in rows:
+            if isinstance(rr, dict):
+                out.append({"status": rr["status"], "count": int(rr["c"])})
+            else:
+                out.append({"status": rr[0], "count": int(rr[1])})
+        return out
+
+    return conditional_json(request, ("tasks",), "all", build)
+
+# ---------- Trends (rollup tables only; refreshed by the "rollups" job) ----------
+def _check_period(period: str) -> str:
+    period = period.strip().lower()
+    if period not in ("day", "week"):
+        raise HTTPException(400, "period must be day|week")
+    return period
+
+@app.get("/analytics/trends/feedback")
+def trends_feedback(request: Request, period: str = "week", intern_id: Optional[str] = None,
+                    u=Depends(require_role("admin","supervisor"))):
+    period = _check_period(period)
+    return conditional_json(request, ("rollups",), "all", lambda: feedback_trend(period, intern_id))
+
+@app.get("/analytics/trends/tasks")
+def trends_tasks(request: Request, period: str = "week", u=Depends(require_role("admin","supervisor"))):
+    period = _check_period(period)
+    return conditional_json(request, ("rollups",), "all", lambda: tasks_trend(period))
+
+@app.get("/analytics/trends/time-to-done")
+def trends_time_to_done(request: Request, period: str = "week", u=Depends(require_role("admin","supervisor"))):
+    period = _check_period(period)
+    return conditional_json(request, ("rollups",), "all", lambda: time_to_done(period))
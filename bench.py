@@ -0,0 +1,146 @@
+"""
+Tiny HTTP load generator (stdlib only) for comparing serving modes.
+
+  python bench.py --url http://127.0.0.1:8000 --path /interns --login admin:admin123
+  python bench.py --url http://127.0.0.1:8000 --path /auth/login --login admin:admin123 -c 16 -n 400
+
+The server's rate limits (limits.py) apply to the benchmark too: start it with
+RATE_AUTH_PER_SEC=1000 RATE_AUTH_BURST=1000 for /auth/login (RATE_READ_* for
+reads), otherwise 429s show up as `rate_limited` instead of throughput.
+
+Run it against `WEB_CONCURRENCY=1` and `WEB_CONCURRENCY=<cores>` to see worker scaling.
+
+  python bench.py --cold-start
+
+measures `import app` in a fresh interpreter and time from process spawn to the
+first successful /health (uvicorn on a spare port, current directory's DB).
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import subprocess
+import threading
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+
+def _request(url, data=None, headers=None):
+    req = urllib.request.Request(url, data=data, headers=headers or {})
+    with urllib.request.urlopen(req, timeout=60) as r:
+        r.read()
+        return r.status
+
+
+def login(base, creds):
+    user, pw = creds.split(":", 1)
+    body = json.dumps({"username": user, "password": pw}).encode()
+    req = urllib.request.Request(base + "/auth/login", data=body, headers={"Content-Type": "application/json"})
+    with urllib.request.urlopen(req, timeout=60) as r:
+        return json.loads(r.read())["access_token"]
+
+
+def run(base, path, n, concurrency, creds=None):
+    headers = {}
+    data = None
+    if path == "/auth/login":
+        user, pw = creds.split(":", 1)
+        data = json.dumps({"username": user, "password": pw}).encode()
+        headers["Content-Type"] = "application/json"
+    elif creds:
+        headers["Authorization"] = "Bearer " + login(base, creds)
+
+    latencies = []
+    errors = [0]
+    limited = [0]
+    lock = threading.Lock()
+
+    def one(_):
+        t0 = time.perf_counter()
+        try:
+            _request(base + path, data, headers)
+        except urllib.error.HTTPError as e:
+            with lock:
+                if e.code == 429:
+                    limited[0] += 1
+                else:
+                    errors[0] += 1
+            return
+        except Exception:
+            with lock:
+                errors[0] += 1
+            return
+        dt = time.perf_counter() - t0
+        with lock:
+            latencies.append(dt)
+
+    t0 = time.perf_counter()
+    with ThreadPoolExecutor(concurrency) as pool:
+        list(pool.map(one, range(n)))
+    wall = time.perf_counter() - t0
+
+    latencies.sort()
+    pct = lambda q: latencies[min(len(latencies) - 1, int(q * len(latencies)))] * 1000 if latencies else 0.0
+    return {
+        "path": path,
+        "requests": n,
+        "concurrency": concurrency,
+        "errors": errors[0],
+        "rate_limited": limited[0],
+        "req_per_sec": round(len(latencies) / wall, 1),
+        "p50_ms": round(pct(0.50), 1),
+        "p95_ms": round(pct(0.95), 1),
+        "p99_ms": round(pct(0.99), 1),
+    }
+
+
+def cold_start(port=8799, timeout=60.0):
+    here = os.path.dirname(os.path.abspath(__file__))
+    env = dict(os.environ, PYTHONPATH=here + os.pathsep + os.environ.get("PYTHONPATH", ""))
+
+    code = "import time; t=time.perf_counter(); import app; print(time.perf_counter()-t)"
+    import_s = float(subprocess.check_output([sys.executable, "-c", code], env=env).decode().strip())
+
+    t0 = time.perf_counter()
+    proc = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app:app", "--port", str(port), "--log-level", "warning"],
+        env=env,
+    )
+    try:
+        first = None
+        while time.perf_counter() - t0 < timeout:
+            try:
+                if _request(f"http://127.0.0.1:{port}/health") == 200:
+                    first = time.perf_counter() - t0
+                    break
+            except Exception:
+                time.sleep(0.02)
+    finally:
+        proc.terminate()
+        proc.wait()
+
+    return {
+        "import_app_ms": round(import_s * 1000, 1),
+        "first_response_ms": round(first * 1000, 1) if first is not None else None,
+        "pandas_at_import": subprocess.check_output(
+            [sys.executable, "-c", "import sys, app; print('pandas' in sys.modules)"], env=env
+        ).decode().strip() == "True",
+    }
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--url", default="http://127.0.0.1:8000")
+    ap.add_argument("--path", default="/health")
+    ap.add_argument("-n", "--requests", type=int, default=1000)
+    ap.add_argument("-c", "--concurrency", type=int, default=32)
+    ap.add_argument("--login", help="user:password (bearer token, or body for /auth/login)")
+    ap.add_argument("--cold-start", action="store_true", help="measure import + time-to-first-response")
+    args = ap.parse_args()
+
+    if args.cold_start:
+        print(json.dumps(cold_start()))
+        raise SystemExit(0)
+    print(json.dumps(run(args.url.rstrip("/"), args.path, args.requests, args.concurrency, args.login)))
@@ -0,0 +1,176 @@
+import os
+import json
+import hashlib
+import threading
+from collections import OrderedDict
+
+from fastapi import Response
+from fastapi.encoders import jsonable_encoder
+from starlette.concurrency import run_in_threadpool
+
+from db import (connect, get_versions, set_read_floor, reset_read_floor, row_to_dict,
+                has_replica, REPLICA_PIN_SEC)
+
+# Conditional GET + in-memory response cache.
+# ETags are derived from the data_versions counters that write handlers bump
+# (db.bump_versions), so they stay correct across worker processes: a request
+# costs one small version read, and If-None-Match hits return 304 before any
+# data row is touched.
+
+CACHE_MAX_ENTRIES = int(os.getenv("CACHE_MAX_ENTRIES", "512"))
+CACHE_MAX_BODY = int(os.getenv("CACHE_MAX_BODY", str(1024 * 1024)))
+
+
+class LRUCache:
+    def __init__(self, max_entries: int = CACHE_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        with self._lock:
+            val = self._data.get(key)
+            if val is None:
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return val
+
+    def put(self, key, val):
+        with self._lock:
+            self._data[key] = val
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+
+response_cache = LRUCache()
+
+
+def make_etag(request, tables, scope, versions) -> str:
+    raw = "|".join([
+        request.url.path,
+        str(request.url.query),
+        str(scope),
+        ",".join(f"{t}={versions[t]}" for t in tables),
+    ])
+    return 'W/"' + hashlib.sha1(raw.encode()).hexdigest()[:20] + '"'
+
+
+def _etag_matches(header: str, etag: str) -> bool:
+    if not header:
+        return False
+    if header.strip() == "*":
+        return True
+    return etag in [t.strip() for t in header.split(",")]
+
+
+def conditional_json(request, tables, scope, build):
+    """
+    Serve build() as JSON with an ETag over `tables` versions.
+    `scope` must capture everything (besides path/query) the response depends
+    on, e.g. the user id for /tasks/my or "all" for shared lists.
+    """
+    conn = connect()
+    versions = get_versions(conn.cursor(), tables)
+    conn.close()
+
+    etag = make_etag(request, tables, scope, versions)
+    headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+
+    if _etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=headers)
+
+    body = response_cache.get(etag)
+    if body is None:
+        # a replica older than these versions must not fill this ETag's entry
+        token = set_read_floor(versions)
+        try:
+            data = build()
+        finally:
+            reset_read_floor(token)
+        body = json.dumps(jsonable_encoder(data)).encode()
+        if len(body) <= CACHE_MAX_BODY:
+            response_cache.put(etag, body)
+
+    return Response(content=body, media_type="application/json", headers=headers)
+
+
+# ---------- Read-your-writes across workers ----------
+# A successful write returns the data_versions it produced, as the
+# `read_floor` cookie and the X-Read-Floor header. Sending either back on
+# later GETs (any worker) makes replica reads wait for those versions, i.e.
+# fall back to the primary until the replica has caught up.
+
+READ_FLOOR_COOKIE = "read_floor"
+READ_FLOOR_HEADER = b"x-read-floor"
+
+
+def _encode_floor(versions) -> str:
+    return "~".join(f"{k}:{v}" for k, v in sorted(versions.items()))
+
+
+def _decode_floor(raw: str):
+    floor = {}
+    for part in raw.split("~"):
+        name, _, ver = part.partition(":")
+        if name and ver.isdigit():
+            floor[name] = int(ver)
+    return floor or None
+
+
+def _request_floor(scope):
+    for name, value in scope.get("headers") or []:
+        if name == READ_FLOOR_HEADER:
+            return _decode_floor(value.decode("latin-1").strip())
+    for name, value in scope.get("headers") or []:
+        if name == b"cookie":
+            for c in value.decode("latin-1").split(";"):
+                k, _, v = c.strip().partition("=")
+                if k == READ_FLOOR_COOKIE:
+                    return _decode_floor(v)
+    return None
+
+
+def _current_floor() -> str:
+    conn = connect()
+    cur = conn.cursor()
+    cur.execute("SELECT name, version FROM data_versions")
+    versions = {r["name"]: int(r["version"]) for r in (row_to_dict(x) for x in cur.fetchall())}
+    conn.close()
+    return _encode_floor(versions)
+
+
+class ReadFloorMiddleware:
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not has_replica():
+            return await self.app(scope, receive, send)
+
+        if scope["method"] in ("GET", "HEAD"):
+            floor = _request_floor(scope)
+            if not floor:
+                return await self.app(scope, receive, send)
+            token = set_read_floor(floor)
+            try:
+                return await self.app(scope, receive, send)
+            finally:
+                reset_read_floor(token)
+
+        async def send_with_floor(message):
+            if message["type"] == "http.response.start" and message["status"] < 400:
+                value = (await run_in_threadpool(_current_floor)).encode()
+                message = dict(message)
+                message["headers"] = list(message.get("headers") or []) + [
+                    (READ_FLOOR_HEADER, value),
+                    (b"set-cookie", b"%s=%s; Max-Age=%d; Path=/; HttpOnly; SameSite=Lax"
+                     % (READ_FLOOR_COOKIE.encode(), value, max(1, int(REPLICA_PIN_SEC)))),
+                ]
+            await send(message)
+
+        await self.app(scope, receive, send_with_floor)
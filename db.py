@@ -1,5 +1,10 @@
 import os
+import time
 import sqlite3
+import threading
+import contextvars
+
+from profiling import traced
 
 def is_postgres() -> bool:
     return bool(os.getenv("DATABASE_URL"))
@@ -8,28 +13,167 @@ def ph() -> str:
     """SQL placeholder depending on DB driver."""
     return "%s" if is_postgres() else "?"
 
-def connect():
+def connect(readonly: bool = False, uid=None):
     """
     - Railway Postgres: uses DATABASE_URL
     - Local: sqlite interns.db
+    readonly=True may be served by the read replica (DATABASE_READ_URL /
+    SQLITE_READ_PATH) unless `uid` wrote recently or the replica is down/lagging.
     """
-    if is_postgres():
-        import psycopg2
-        from psycopg2.extras import RealDictCursor
+    conn = None
+    if readonly and has_replica() and not _pinned(uid):
+        conn = _open_replica()
+    if conn is None:
+        conn = _open()
+    # SQL timing for admin-triggered request profiles (no-op otherwise)
+    return traced(conn)
+
+def _normalize_pg_url(db_url):
+    db_url = (db_url or "").strip()
+    # Some providers still output postgres:// which psycopg2 accepts, but we normalize anyway
+    if db_url.startswith("postgres://"):
+        db_url = db_url.replace("postgres://", "postgresql://", 1)
+    return db_url
 
-        db_url = os.getenv("DATABASE_URL", "").strip()
-        # Some providers still output postgres:// which psycopg2 accepts, but we normalize anyway
-        if db_url.startswith("postgres://"):
-            db_url = db_url.replace("postgres://", "postgresql://", 1)
+def _open_pg(db_url):
+    import psycopg2
+    from psycopg2.extras import RealDictCursor
 
-        return psycopg2.connect(db_url, cursor_factory=RealDictCursor)
+    return psycopg2.connect(_normalize_pg_url(db_url), cursor_factory=RealDictCursor)
 
-    conn = sqlite3.connect("interns.db", check_same_thread=False)
+def _open():
+    if is_postgres():
+        return _open_pg(os.getenv("DATABASE_URL", ""))
+
+    # timeout = busy wait when another worker process holds the write lock
+    conn = sqlite3.connect("interns.db", check_same_thread=False, timeout=30)
     conn.row_factory = sqlite3.Row
     # ✅ SQLite: foreign keys are OFF by default
     conn.execute("PRAGMA foreign_keys = ON;")
     return conn
 
+# ---------- Read replica routing ----------
+# Reads go to the replica only when it is reachable, within
+# REPLICA_MAX_LAG_SEC, not pinned by a recent write from the same user in this
+# process, and at least as new as the request's read floor: the versions an
+# ETag was built from (conditional_json), or the versions of the client's own
+# last write, sent back from any worker (cache.ReadFloorMiddleware).
+
+REPLICA_MAX_LAG_SEC = float(os.getenv("REPLICA_MAX_LAG_SEC", "10"))
+REPLICA_PIN_SEC = float(os.getenv("REPLICA_PIN_SEC", str(REPLICA_MAX_LAG_SEC)))
+REPLICA_RETRY_SEC = float(os.getenv("REPLICA_RETRY_SEC", "30"))
+REPLICA_LAG_CHECK_SEC = float(os.getenv("REPLICA_LAG_CHECK_SEC", "5"))
+
+_replica = {"down_until": 0.0, "lag": 0.0, "lag_checked": 0.0, "errors": 0, "served": 0, "fallbacks": 0}
+_replica_lock = threading.Lock()
+_write_pins = {}  # user id -> monotonic time until which reads stay on the primary
+_read_floor = contextvars.ContextVar("read_floor", default=None)
+
+def _replica_target() -> str:
+    if is_postgres():
+        return os.getenv("DATABASE_READ_URL", "").strip()
+    return os.getenv("SQLITE_READ_PATH", "").strip()
+
+def has_replica() -> bool:
+    return bool(_replica_target())
+
+def pin_primary(uid):
+    """Keep this user's reads on the primary for a while (read-your-own-writes)."""
+    if uid is None or not has_replica():
+        return
+    with _replica_lock:
+        now = time.monotonic()
+        _write_pins[uid] = now + REPLICA_PIN_SEC
+        if len(_write_pins) > 10000:
+            for k in [k for k, t in _write_pins.items() if t < now]:
+                del _write_pins[k]
+
+def _pinned(uid) -> bool:
+    if uid is None:
+        return False
+    return _write_pins.get(uid, 0.0) > time.monotonic()
+
+def set_read_floor(versions):
+    """Require replica reads in this context to be at least these data_versions."""
+    return _read_floor.set(versions)
+
+def reset_read_floor(token):
+    _read_floor.reset(token)
+
+def _replica_lag(conn) -> float:
+    if is_postgres():
+        cur = conn.cursor()
+        cur.execute("""
+          SELECT CASE WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+                      ELSE EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()) END AS lag
+        """)
+        r = cur.fetchone()
+        lag = r["lag"] if isinstance(r, dict) else r[0]
+        return float(lag or 0)  # NULL: not a streaming standby
+
+    # file replica: how far its copy trails the primary's last write
+    def mtime(path):
+        return os.path.getmtime(path) if os.path.exists(path) else 0.0
+    primary = max(mtime("interns.db"), mtime("interns.db-wal"))
+    return max(0.0, primary - mtime(_replica_target()))
+
+def _open_replica():
+    """Replica connection, or None when the primary should be used instead."""
+    now = time.monotonic()
+    if _replica["down_until"] > now:
+        return None
+
+    conn = None
+    try:
+        if is_postgres():
+            conn = _open_pg(_replica_target())
+        else:
+            conn = sqlite3.connect(f"file:{_replica_target()}?mode=ro", uri=True, check_same_thread=False)
+            conn.row_factory = sqlite3.Row
+
+        if now - _replica["lag_checked"] > REPLICA_LAG_CHECK_SEC:
+            lag = _replica_lag(conn)
+            with _replica_lock:
+                _replica["lag"], _replica["lag_checked"] = lag, now
+        if _replica["lag"] > REPLICA_MAX_LAG_SEC:
+            conn.close()
+            _replica["fallbacks"] += 1
+            return None
+
+        floor = _read_floor.get()
+        if floor:
+            have = get_versions(conn.cursor(), floor.keys())
+            if any(have[k] < v for k, v in floor.items()):
+                conn.close()
+                _replica["fallbacks"] += 1
+                return None
+    except Exception:
+        if conn is not None:
+            try:
+                conn.close()
+            except Exception:
+                pass
+        with _replica_lock:
+            _replica["errors"] += 1
+            _replica["down_until"] = now + REPLICA_RETRY_SEC
+        return None
+
+    _replica["served"] += 1
+    return conn
+
+def replica_status() -> dict:
+    now = time.monotonic()
+    return {
+        "configured": has_replica(),
+        "available": has_replica() and _replica["down_until"] <= now,
+        "lag_sec": round(_replica["lag"], 3),
+        "max_lag_sec": REPLICA_MAX_LAG_SEC,
+        "served": _replica["served"],
+        "fallbacks": _replica["fallbacks"],
+        "errors": _replica["errors"],
+        "pinned_users": sum(1 for t in list(_write_pins.values()) if t > now),
+    }
+
 def row_to_dict(r):
     if r is None:
         return None
@@ -37,10 +181,37 @@ def row_to_dict(r):
         return r
     return dict(r)
 
-def init_db():
-    conn = connect()
-    cur = conn.cursor()
+def bump_versions(cur, *names):
+    """
+    Bump shared change counters for the given tables.
+    Call inside the writing transaction so every worker process sees the
+    new version exactly when it sees the new rows.
+    """
+    p = ph()
+    for name in names:
+        cur.execute(f"""
+          INSERT INTO data_versions(name, version) VALUES ({p}, 1)
+          ON CONFLICT(name) DO UPDATE SET version = data_versions.version + 1
+        """, (name,))
+
+def get_versions(cur, names) -> dict:
+    """Current change counters (0 for tables never written)."""
+    names = list(names)
+    p = ph()
+    cur.execute(f"SELECT name, version FROM data_versions WHERE name IN ({','.join([p] * len(names))})", names)
+    found = {}
+    for r in cur.fetchall():
+        r = row_to_dict(r)
+        found[r["name"]] = int(r["version"])
+    return {n: found.get(n, 0) for n in names}
+
+# ---------- Schema migrations ----------
+# Append new steps to MIGRATIONS; never edit a step that has shipped.
+# Step 1 is the original schema (IF NOT EXISTS), so databases created
+# before versioning upgrade cleanly.
 
+def _m001_base(cur):
+    """interns, users, tasks, task_updates, supervisor_feedback, rag_records"""
     if is_postgres():
         # -------------------- INTERNS --------------------
         cur.execute("""
@@ -127,9 +298,7 @@ def init_db():
         cur.execute("""
         CREATE INDEX IF NOT EXISTS idx_rag_intern ON rag_records(intern_id_info);
         """)
-
     else:
-        # -------------------- SQLITE VERSION --------------------
         cur.execute("""
         CREATE TABLE IF NOT EXISTS interns(
             id_info TEXT PRIMARY KEY,
@@ -211,5 +380,326 @@ def init_db():
         CREATE INDEX IF NOT EXISTS idx_rag_intern ON rag_records(intern_id_info);
         """)
 
+def _m002_search(cur):
+    """full-text search indexes (search.py queries must match these expressions)"""
+    if is_postgres():
+        cur.execute("""
+        CREATE INDEX IF NOT EXISTS idx_interns_fts ON interns USING GIN (to_tsvector('english',
+          coalesce(name,'') || ' ' || coalesce(learning_skill,'') || ' ' ||
+          coalesce(working_on_project,'') || ' ' || coalesce(knowledge_gained,'')));
+        """)
+        cur.execute("""
+        CREATE INDEX IF NOT EXISTS idx_tasks_fts ON tasks USING GIN (to_tsvector('english',
+          coalesce(title,'') || ' ' || coalesce(description,'')));
+        """)
+        cur.execute("""
+        CREATE INDEX IF NOT EXISTS idx_task_updates_fts ON task_updates USING GIN (to_tsvector('english',
+          coalesce(message,'')));
+        """)
+        return
+
+    # FTS5 external-content tables kept in sync by triggers
+    fts_tables = {
+        "interns_fts": ("interns", ["name", "learning_skill", "working_on_project", "knowledge_gained"]),
+        "tasks_fts": ("tasks", ["title", "description"]),
+        "task_updates_fts": ("task_updates", ["message"]),
+    }
+    for fts, (table, cols) in fts_tables.items():
+        cur.execute("SELECT 1 FROM sqlite_master WHERE type='table' AND name=?", (fts,))
+        exists = cur.fetchone() is not None
+
+        col_list = ", ".join(cols)
+        new_vals = ", ".join(f"new.{c}" for c in cols)
+        old_vals = ", ".join(f"old.{c}" for c in cols)
+
+        cur.execute(f"""
+        CREATE VIRTUAL TABLE IF NOT EXISTS {fts} USING fts5({col_list}, content='{table}', content_rowid='rowid');
+        """)
+        cur.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS {fts}_ai AFTER INSERT ON {table} BEGIN
+          INSERT INTO {fts}(rowid, {col_list}) VALUES (new.rowid, {new_vals});
+        END;
+        """)
+        cur.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS {fts}_ad AFTER DELETE ON {table} BEGIN
+          INSERT INTO {fts}({fts}, rowid, {col_list}) VALUES ('delete', old.rowid, {old_vals});
+        END;
+        """)
+        # only reindex when searchable columns change (not on status updates)
+        cur.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS {fts}_au AFTER UPDATE OF {col_list} ON {table} BEGIN
+          INSERT INTO {fts}({fts}, rowid, {col_list}) VALUES ('delete', old.rowid, {old_vals});
+          INSERT INTO {fts}(rowid, {col_list}) VALUES (new.rowid, {new_vals});
+        END;
+        """)
+
+        if not exists:
+            # index rows that were there before search was added
+            cur.execute(f"INSERT INTO {fts}({fts}) VALUES ('rebuild')")
+
+def _m003_feedback_index(cur):
+    """latest-feedback lookups (export)"""
+    if is_postgres():
+        cur.execute("""
+        CREATE INDEX IF NOT EXISTS idx_feedback_intern ON supervisor_feedback(intern_id_info, id);
+        """)
+    else:
+        cur.execute("""
+        CREATE INDEX IF NOT EXISTS idx_feedback_intern ON supervisor_feedback(intern_id_info, id);
+        """)
+
+def _m004_multiworker(cur):
+    """shared change counters + live feed outbox"""
+    if is_postgres():
+        cur.execute("""
+        CREATE TABLE IF NOT EXISTS data_versions(
+            name TEXT PRIMARY KEY,
+            version BIGINT NOT NULL DEFAULT 0
+        );
+        """)
+
+        cur.execute("""
+        CREATE TABLE IF NOT EXISTS live_events(
+            id BIGSERIAL PRIMARY KEY,
+            kind TEXT NOT NULL,
+            payload TEXT NOT NULL,
+            assigned_to_user_id BIGINT,
+            assigned_by_user_id BIGINT,
+            created_at TIMESTAMP DEFAULT NOW()
+        );
+        """)
+    else:
+        cur.execute("""
+        CREATE TABLE IF NOT EXISTS data_versions(
+            name TEXT PRIMARY KEY,
+            version INTEGER NOT NULL DEFAULT 0
+        );
+        """)
+
+        cur.execute("""
+        CREATE TABLE IF NOT EXISTS live_events(
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            kind TEXT NOT NULL,
+            payload TEXT NOT NULL,
+            assigned_to_user_id INTEGER,
+            assigned_by_user_id INTEGER,
+            created_at TEXT DEFAULT (datetime('now'))
+        );
+        """)
+
+def _m005_retention(cur):
+    """task_updates index, archive table, job leases"""
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_task_updates_task ON task_updates(task_id, id);")
+    if is_postgres():
+        cur.execute("""
+        CREATE TABLE IF NOT EXISTS task_updates_archive(
+            id BIGINT PRIMARY KEY,
+            task_id BIGINT NOT NULL REFERENCES tasks(id) ON DELETE CASCADE,
+            intern_user_id BIGINT,
+            message TEXT NOT NULL,
+            created_at TIMESTAMP,
+            archived_at TIMESTAMP DEFAULT NOW()
+        );
+        """)
+
+        cur.execute("""
+        CREATE TABLE IF NOT EXISTS job_leases(
+            name TEXT PRIMARY KEY,
+            owner TEXT,
+            expires_at DOUBLE PRECISION NOT NULL
+        );
+        """)
+    else:
+        cur.execute("""
+        CREATE TABLE IF NOT EXISTS task_updates_archive(
+            id INTEGER PRIMARY KEY,
+            task_id INTEGER NOT NULL REFERENCES tasks(id) ON DELETE CASCADE,
+            intern_user_id INTEGER,
+            message TEXT NOT NULL,
+            created_at TEXT,
+            archived_at TEXT DEFAULT (datetime('now'))
+        );
+        """)
+
+        cur.execute("""
+        CREATE TABLE IF NOT EXISTS job_leases(
+            name TEXT PRIMARY KEY,
+            owner TEXT,
+            expires_at REAL NOT NULL
+        );
+        """)
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_task_updates_archive_task ON task_updates_archive(task_id, id);")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_rag_created ON rag_records(created_at);")
+
+def _m006_rollups(cur):
+    """tasks.completed_at + trend rollup tables"""
+    if is_postgres():
+        cur.execute("ALTER TABLE tasks ADD COLUMN IF NOT EXISTS completed_at TIMESTAMP NULL;")
+        cur.execute("""
+        CREATE TABLE IF NOT EXISTS rollup_feedback(
+            period TEXT NOT NULL,              -- day|week
+            bucket_start TEXT NOT NULL,
+            intern_id_info TEXT NOT NULL,
+            rating_sum DOUBLE PRECISION NOT NULL DEFAULT 0,
+            rating_count BIGINT NOT NULL DEFAULT 0,
+            PRIMARY KEY (period, bucket_start, intern_id_info)
+        );
+        """)
+
+        cur.execute("""
+        CREATE TABLE IF NOT EXISTS rollup_tasks(
+            period TEXT NOT NULL,
+            bucket_start TEXT NOT NULL,
+            created BIGINT NOT NULL DEFAULT 0,
+            completed BIGINT NOT NULL DEFAULT 0,
+            done_hours_sum DOUBLE PRECISION NOT NULL DEFAULT 0,
+            PRIMARY KEY (period, bucket_start)
+        );
+        """)
+
+        cur.execute("""
+        CREATE TABLE IF NOT EXISTS rollup_time_to_done(
+            period TEXT NOT NULL,
+            bucket_start TEXT NOT NULL,
+            range_label TEXT NOT NULL,
+            count BIGINT NOT NULL DEFAULT 0,
+            PRIMARY KEY (period, bucket_start, range_label)
+        );
+        """)
+    else:
+        cur.execute("ALTER TABLE tasks ADD COLUMN completed_at TEXT;")
+        cur.execute("""
+        CREATE TABLE IF NOT EXISTS rollup_feedback(
+            period TEXT NOT NULL,
+            bucket_start TEXT NOT NULL,
+            intern_id_info TEXT NOT NULL,
+            rating_sum REAL NOT NULL DEFAULT 0,
+            rating_count INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (period, bucket_start, intern_id_info)
+        );
+        """)
+
+        cur.execute("""
+        CREATE TABLE IF NOT EXISTS rollup_tasks(
+            period TEXT NOT NULL,
+            bucket_start TEXT NOT NULL,
+            created INTEGER NOT NULL DEFAULT 0,
+            completed INTEGER NOT NULL DEFAULT 0,
+            done_hours_sum REAL NOT NULL DEFAULT 0,
+            PRIMARY KEY (period, bucket_start)
+        );
+        """)
+
+        cur.execute("""
+        CREATE TABLE IF NOT EXISTS rollup_time_to_done(
+            period TEXT NOT NULL,
+            bucket_start TEXT NOT NULL,
+            range_label TEXT NOT NULL,
+            count INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (period, bucket_start, range_label)
+        );
+        """)
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_tasks_completed ON tasks(completed_at);")
+    cur.execute("CREATE TABLE IF NOT EXISTS rollup_state(name TEXT PRIMARY KEY, hwm TEXT NOT NULL);")
+
+def _m007_reminders(cur):
+    """due-date index + sent reminder log"""
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_tasks_status_due ON tasks(status, due_date);")
+    if is_postgres():
+        cur.execute("""
+        CREATE TABLE IF NOT EXISTS task_reminders(
+            task_id BIGINT NOT NULL REFERENCES tasks(id) ON DELETE CASCADE,
+            kind TEXT NOT NULL,                -- soon|overdue
+            sent_at TIMESTAMP DEFAULT NOW(),
+            PRIMARY KEY (task_id, kind)
+        );
+        """)
+    else:
+        cur.execute("""
+        CREATE TABLE IF NOT EXISTS task_reminders(
+            task_id INTEGER NOT NULL REFERENCES tasks(id) ON DELETE CASCADE,
+            kind TEXT NOT NULL,
+            sent_at TEXT DEFAULT (datetime('now')),
+            PRIMARY KEY (task_id, kind)
+        );
+        """)
+
+def _m008_rollup_done(cur):
+    """tasks already folded into the completion rollups (count each task once)"""
+    if is_postgres():
+        cur.execute("""
+        CREATE TABLE IF NOT EXISTS rollup_done(
+            task_id BIGINT PRIMARY KEY REFERENCES tasks(id) ON DELETE CASCADE
+        );
+        """)
+        cur.execute("""
+        INSERT INTO rollup_done(task_id)
+        SELECT t.id FROM tasks t JOIN rollup_state s ON s.name = 'tasks_completed_at'
+        WHERE t.completed_at <= CAST(s.hwm AS TIMESTAMP)
+        ON CONFLICT DO NOTHING;
+        """)
+    else:
+        cur.execute("""
+        CREATE TABLE IF NOT EXISTS rollup_done(
+            task_id INTEGER PRIMARY KEY REFERENCES tasks(id) ON DELETE CASCADE
+        );
+        """)
+        cur.execute("""
+        INSERT OR IGNORE INTO rollup_done(task_id)
+        SELECT t.id FROM tasks t JOIN rollup_state s ON s.name = 'tasks_completed_at'
+        WHERE t.completed_at <= s.hwm;
+        """)
+
+MIGRATIONS = [
+    (1, _m001_base),
+    (2, _m002_search),
+    (3, _m003_feedback_index),
+    (4, _m004_multiworker),
+    (5, _m005_retention),
+    (6, _m006_rollups),
+    (7, _m007_reminders),
+    (8, _m008_rollup_done),
+]
+SCHEMA_VERSION = MIGRATIONS[-1][0]
+
+def schema_version(conn) -> int:
+    """Applied schema version (0 for a fresh or pre-versioning database)."""
+    cur = conn.cursor()
+    try:
+        cur.execute("SELECT MAX(version) AS v FROM schema_version")
+        r = cur.fetchone()
+    except Exception:
+        conn.rollback()  # Postgres aborts the transaction on a missing table
+        return 0
+    v = r["v"] if isinstance(r, dict) else r[0]
+    return int(v or 0)
+
+def init_db():
+    conn = connect()
+
+    # fast path: an up-to-date database costs a single read
+    if schema_version(conn) >= SCHEMA_VERSION:
+        conn.close()
+        return
+
+    cur = conn.cursor()
+    # several workers may boot at once: serialize schema setup
+    if is_postgres():
+        cur.execute("SELECT pg_advisory_xact_lock(727001)")
+    else:
+        # WAL lets readers in other processes run alongside the single writer
+        cur.execute("PRAGMA journal_mode=WAL;")
+        cur.execute("BEGIN IMMEDIATE")
+
+    cur.execute("CREATE TABLE IF NOT EXISTS schema_version(version INTEGER PRIMARY KEY)")
+    current = schema_version(conn)  # re-read: another worker may have migrated
+
+    p = ph()
+    for version, migrate in MIGRATIONS:
+        if version <= current:
+            continue
+        migrate(cur)
+        cur.execute(f"INSERT INTO schema_version(version) VALUES ({p})", (version,))
+
     conn.commit()
     conn.close()
@@ -0,0 +1,237 @@
+import os
+import time
+import asyncio
+import json
+import threading
+from collections import deque
+
+from db import connect, ph, row_to_dict
+
+# In-process broadcast hub for the live task feed (/tasks/live).
+# Handlers publish small deltas after commit; every open SSE connection owns
+# one bounded asyncio.Queue, so an idle subscriber costs one parked coroutine.
+#
+# With several worker processes (LIVE_SHARED=1, or WEB_CONCURRENCY > 1 when
+# unset) events go through the live_events table instead: one relay thread per
+# process polls it and fans out locally, so event ids (the resume cursor) are
+# the same on every worker. `uvicorn --workers N` sets neither: pass
+# LIVE_SHARED=1 (or WEB_CONCURRENCY=N) yourself.
+
+BACKLOG = 2000      # recent events kept for resume (?since= / Last-Event-ID)
+QUEUE_SIZE = 256    # per-connection buffer before the client is told to refetch
+SHARED = os.getenv("LIVE_SHARED", "1" if int(os.getenv("WEB_CONCURRENCY", "1")) > 1 else "0") == "1"
+POLL_SEC = float(os.getenv("LIVE_POLL_SEC", "0.5"))
+GAP_WAIT_SEC = 5.0  # how long to wait for a skipped id (slow concurrent commit)
+
+
+class Subscription:
+    def __init__(self, hub, user, loop):
+        self.hub = hub
+        self.user = user
+        self.loop = loop
+        self.queue = asyncio.Queue(maxsize=QUEUE_SIZE)
+        self.lagged = False
+
+    def offer(self, ev):
+        # runs on the subscriber's event loop
+        try:
+            self.queue.put_nowait(ev)
+        except asyncio.QueueFull:
+            self.lagged = True
+
+
+class LiveHub:
+    def __init__(self, backlog: int = BACKLOG, shared: bool = SHARED):
+        self._lock = threading.Lock()
+        # ids start at the boot time (us) so a cursor from an earlier process
+        # is always below this process's backlog and gets a reset
+        self._seq = time.time_ns() // 1000
+        self._recent = deque(maxlen=backlog)
+        self._admins = set()
+        self._by_user = {}  # user id -> set(Subscription)
+        self.shared = shared
+        self._relay = None
+
+    def _visible(self, user, ev) -> bool:
+        if user["role"] == "admin":
+            return True
+        if user["role"] == "supervisor":
+            return ev["assigned_by_user_id"] == user["id"]
+        return ev["assigned_to_user_id"] == user["id"]
+
+    def publish(self, kind: str, data: dict, assigned_to_user_id, assigned_by_user_id):
+        """Fan an event out to matching subscribers. Safe to call from any thread."""
+        if self.shared:
+            conn = connect()
+            cur = conn.cursor()
+            p = ph()
+            cur.execute(f"""
+              INSERT INTO live_events(kind, payload, assigned_to_user_id, assigned_by_user_id)
+              VALUES ({p},{p},{p},{p})
+            """, (kind, json.dumps(data, default=str), assigned_to_user_id, assigned_by_user_id))
+            conn.commit()
+            conn.close()
+            return None
+
+        with self._lock:
+            self._seq += 1
+            ev_id = self._seq
+        self._deliver(ev_id, kind, data, assigned_to_user_id, assigned_by_user_id)
+        return ev_id
+
+    def _deliver(self, ev_id, kind, data, assigned_to_user_id, assigned_by_user_id):
+        ev = {
+            "id": ev_id,
+            "event": kind,
+            "data": data,
+            "assigned_to_user_id": assigned_to_user_id,
+            "assigned_by_user_id": assigned_by_user_id,
+        }
+        with self._lock:
+            self._seq = max(self._seq, ev_id)
+            self._recent.append(ev)
+            targets = set(self._admins)
+            targets |= self._by_user.get(assigned_to_user_id, set())
+            targets |= self._by_user.get(assigned_by_user_id, set())
+
+        for sub in targets:
+            if self._visible(sub.user, ev):
+                try:
+                    sub.loop.call_soon_threadsafe(sub.offer, ev)
+                except RuntimeError:
+                    # loop already closed; the connection is going away
+                    pass
+
+    # ---------- cross-process relay ----------
+    def start_relay(self):
+        """Start the live_events poller (multi-worker mode only)."""
+        if not self.shared or self._relay is not None:
+            return
+        conn = connect()
+        cur = conn.cursor()
+        cur.execute("SELECT COALESCE(MAX(id), 0) AS m FROM live_events")
+        r = cur.fetchone()
+        conn.close()
+        self._seq = int(r["m"] if isinstance(r, dict) else r[0])
+
+        self._relay = threading.Thread(target=self._relay_loop, name="live-relay", daemon=True)
+        self._relay.start()
+
+    def _relay_loop(self):
+        conn = None
+        hwm = self._seq
+        gaps = {}  # missing id -> deadline; ids can commit out of order on Postgres
+        polls = 0
+        while True:
+            time.sleep(POLL_SEC)
+            polls += 1
+            try:
+                if conn is None:
+                    conn = connect()
+                cur = conn.cursor()
+                p = ph()
+                cur.execute(f"""
+                  SELECT id, kind, payload, assigned_to_user_id, assigned_by_user_id
+                  FROM live_events WHERE id > {p} ORDER BY id LIMIT 1000
+                """, (hwm,))
+                rows = [row_to_dict(r) for r in cur.fetchall()]
+
+                now = time.monotonic()
+                gaps = {i: d for i, d in gaps.items() if d > now}
+                if gaps:
+                    ids = list(gaps)
+                    cur.execute(f"""
+                      SELECT id, kind, payload, assigned_to_user_id, assigned_by_user_id
+                      FROM live_events WHERE id IN ({','.join([p] * len(ids))})
+                    """, ids)
+                    late = [row_to_dict(r) for r in cur.fetchall()]
+                    for r in late:
+                        gaps.pop(r["id"], None)
+                    rows = late + rows
+
+                for r in rows:
+                    if r["id"] > hwm:
+                        for missing in range(hwm + 1, r["id"]):
+                            gaps[missing] = now + GAP_WAIT_SEC
+                        hwm = r["id"]
+                    self._deliver(r["id"], r["kind"], json.loads(r["payload"]),
+                                  r["assigned_to_user_id"], r["assigned_by_user_id"])
+
+                if polls % 600 == 0:
+                    # keep the outbox small; the in-memory backlog covers resume
+                    cur.execute(f"DELETE FROM live_events WHERE id < {p}", (hwm - 10 * BACKLOG,))
+                conn.commit()  # ends the read snapshot on Postgres
+            except Exception:
+                if conn is not None:
+                    try:
+                        conn.close()
+                    except Exception:
+                        pass
+                conn = None
+
+    def subscribe(self, user, since=None):
+        """Register a subscriber; returns (subscription, replay events, needs_reset)."""
+        sub = Subscription(self, user, asyncio.get_running_loop())
+        with self._lock:
+            if user["role"] == "admin":
+                self._admins.add(sub)
+            else:
+                self._by_user.setdefault(user["id"], set()).add(sub)
+
+            replay, reset = [], False
+            if since is not None:
+                oldest = self._recent[0]["id"] if self._recent else self._seq + 1
+                # cursor from before our backlog or from a previous process
+                reset = since > self._seq or since < oldest - 1
+                if not reset:
+                    replay = [ev for ev in self._recent
+                              if ev["id"] > since and self._visible(user, ev)]
+        return sub, replay, reset
+
+    def unsubscribe(self, sub):
+        with self._lock:
+            self._admins.discard(sub)
+            subs = self._by_user.get(sub.user["id"])
+            if subs is not None:
+                subs.discard(sub)
+                if not subs:
+                    del self._by_user[sub.user["id"]]
+
+    @property
+    def last_id(self) -> int:
+        return self._seq
+
+
+def sse_format(ev) -> str:
+    return f"id: {ev['id']}\nevent: {ev['event']}\ndata: {json.dumps(ev['data'], default=str)}\n\n"
+
+
+async def sse_stream(hub: LiveHub, user, since=None, keepalive: float = 15.0):
+    """Async generator of SSE frames for one connection."""
+    sub, replay, reset = hub.subscribe(user, since)
+    try:
+        yield "retry: 3000\n\n"
+        if reset:
+            # client must re-read /tasks/my and resume from the id given here
+            yield f"id: {hub.last_id}\nevent: reset\ndata: {{}}\n\n"
+        for ev in replay:
+            yield sse_format(ev)
+
+        while True:
+            try:
+                ev = await asyncio.wait_for(sub.queue.get(), timeout=keepalive)
+            except asyncio.TimeoutError:
+                yield ": ping\n\n"
+                continue
+            if sub.lagged:
+                sub.lagged = False
+                while not sub.queue.empty():
+                    sub.queue.get_nowait()
+                yield f"id: {hub.last_id}\nevent: reset\ndata: {{}}\n\n"
+                continue
+            yield sse_format(ev)
+    finally:
+        hub.unsubscribe(sub)
+
+
+hub = LiveHub()
@@ -0,0 +1,149 @@
+import io
+import csv
+import json
+from db import connect, is_postgres, row_to_dict
+
+# Streaming export of interns + task stats + latest supervisor feedback.
+# Rows are pulled in batches (named server-side cursor on Postgres, fetchmany
+# on SQLite) so memory stays bounded and the first bytes go out immediately.
+
+EXPORT_BATCH = 2000
+EXPORT_FORMATS = ("csv", "ndjson", "parquet")
+
+EXPORT_COLUMNS = [
+    "id_info", "name", "email", "learning_skill", "working_on_project",
+    "progress_rating_num", "status",
+    "total_tasks", "todo_tasks", "in_progress_tasks", "done_tasks",
+    "latest_feedback_rating", "latest_feedback_note", "latest_feedback_by", "latest_feedback_at",
+]
+
+EXPORT_SQL = """
+SELECT i.id_info, i.name, i.email, i.learning_skill, i.working_on_project,
+       i.progress_rating_num, i.status,
+       COALESCE(ts.total_tasks, 0) AS total_tasks,
+       COALESCE(ts.todo_tasks, 0) AS todo_tasks,
+       COALESCE(ts.in_progress_tasks, 0) AS in_progress_tasks,
+       COALESCE(ts.done_tasks, 0) AS done_tasks,
+       fb.rating AS latest_feedback_rating,
+       fb.note AS latest_feedback_note,
+       fb.supervisor_name AS latest_feedback_by,
+       fb.created_at AS latest_feedback_at
+FROM interns i
+LEFT JOIN (
+    SELECT u.intern_id_info,
+           COUNT(*) AS total_tasks,
+           SUM(CASE WHEN t.status='todo' THEN 1 ELSE 0 END) AS todo_tasks,
+           SUM(CASE WHEN t.status='in_progress' THEN 1 ELSE 0 END) AS in_progress_tasks,
+           SUM(CASE WHEN t.status='done' THEN 1 ELSE 0 END) AS done_tasks
+    FROM users u JOIN tasks t ON t.assigned_to_user_id = u.id
+    WHERE u.intern_id_info IS NOT NULL
+    GROUP BY u.intern_id_info
+) ts ON ts.intern_id_info = i.id_info
+LEFT JOIN supervisor_feedback fb ON fb.id = (
+    SELECT MAX(f2.id) FROM supervisor_feedback f2 WHERE f2.intern_id_info = i.id_info
+)
+ORDER BY i.id_info
+"""
+
+
+def iter_batches(batch_size: int = EXPORT_BATCH, uid=None):
+    """Yield lists of row dicts without materializing the whole result."""
+    conn = connect(readonly=True, uid=uid)
+    try:
+        if is_postgres():
+            # named cursor = server-side; rows arrive itersize at a time
+            cur = conn.cursor(name="export_interns")
+            cur.itersize = batch_size
+        else:
+            cur = conn.cursor()
+        cur.execute(EXPORT_SQL)
+        while True:
+            rows = cur.fetchmany(batch_size)
+            if not rows:
+                break
+            yield [row_to_dict(r) for r in rows]
+        cur.close()
+    finally:
+        conn.close()
+
+
+def stream_csv(batch_size: int = EXPORT_BATCH, uid=None):
+    buf = io.StringIO()
+    writer = csv.DictWriter(buf, fieldnames=EXPORT_COLUMNS)
+    writer.writeheader()
+    yield buf.getvalue()
+    for rows in iter_batches(batch_size, uid):
+        buf.seek(0)
+        buf.truncate()
+        writer.writerows(rows)
+        yield buf.getvalue()
+
+
+def stream_ndjson(batch_size: int = EXPORT_BATCH, uid=None):
+    for rows in iter_batches(batch_size, uid):
+        yield "".join(json.dumps(r, default=str) + "\n" for r in rows)
+
+
+class _ChunkSink:
+    """Write-only file for ParquetWriter; bytes are drained after each row group."""
+
+    def __init__(self):
+        self._chunks = []
+        self._pos = 0
+        self.closed = False
+
+    def write(self, b):
+        self._chunks.append(bytes(b))
+        self._pos += len(b)
+        return len(b)
+
+    def tell(self):
+        return self._pos
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def writable(self):
+        return True
+
+    def drain(self) -> bytes:
+        out = b"".join(self._chunks)
+        self._chunks = []
+        return out
+
+
+def stream_parquet(batch_size: int = EXPORT_BATCH, uid=None):
+    # optional dependency: only needed for this format
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    ints = {"total_tasks", "todo_tasks", "in_progress_tasks", "done_tasks", "latest_feedback_rating"}
+    schema = pa.schema([
+        (c, pa.float64() if c == "progress_rating_num" else pa.int64() if c in ints else pa.string())
+        for c in EXPORT_COLUMNS
+    ])
+
+    sink = _ChunkSink()
+    writer = pq.ParquetWriter(sink, schema)
+    for rows in iter_batches(batch_size, uid):
+        cols = {}
+        for c in EXPORT_COLUMNS:
+            vals = [r.get(c) for r in rows]
+            if schema.field(c).type == pa.string():
+                vals = [None if v is None else str(v) for v in vals]
+            cols[c] = vals
+        writer.write_table(pa.table(cols, schema=schema))  # one row group per batch
+        yield sink.drain()
+    writer.close()
+    yield sink.drain()
+
+
+def parquet_available() -> bool:
+    try:
+        import pyarrow.parquet  # noqa: F401
+        return True
+    except ImportError:
+        return False
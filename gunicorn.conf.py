@@ -0,0 +1,50 @@
+import os
+import multiprocessing
+
+# Multi-process serving: gunicorn master + uvicorn workers.
+#
+# Worker count (WEB_CONCURRENCY):
+# - PBKDF2 logins, dataset upload (pandas) and analytics are CPU-bound, so one
+#   worker per core is the sweet spot; more workers than cores only adds RAM.
+# - each worker already runs sync handlers on its own threadpool, so I/O waits
+#   (Postgres, SMTP) don't need extra processes.
+# - on a 512MB free instance keep it at 1-2; each worker holds its own
+#   pandas import and connection set.
+# - SQLite: fine for a few workers (WAL + busy timeout), but every write is
+#   still serialized; use Postgres (DATABASE_URL) before going wide.
+#
+# Compare with bench.py, e.g.
+#   WEB_CONCURRENCY=1 gunicorn app:app -c gunicorn.conf.py &
+#   python bench.py --url http://127.0.0.1:8000 --path /auth/login --login admin:admin123
+# (for /auth/login start the server with RATE_AUTH_PER_SEC=1000 RATE_AUTH_BURST=1000,
+# otherwise limits.py answers most of the run with 429)
+#
+# Without gunicorn, `uvicorn app:app --workers N` needs LIVE_SHARED=1 in the
+# environment, otherwise each worker keeps its own live feed.
+
+workers = int(os.getenv("WEB_CONCURRENCY", str(min(multiprocessing.cpu_count(), 4))))
+worker_class = "uvicorn.workers.UvicornWorker"
+bind = f"0.0.0.0:{os.getenv('PORT', '8000')}"
+timeout = int(os.getenv("GUNICORN_TIMEOUT", "120"))  # dataset upload can be slow
+graceful_timeout = 30
+# Trust X-Forwarded-For from these proxy addresses/CIDRs so request.client
+# (and the per-IP rate limits in limits.py) is the real client: the rightmost
+# entry not added by a trusted proxy. Set it to the proxy's range; "*" is only
+# safe behind a proxy that overwrites (not appends to) X-Forwarded-For, since
+# with "*" the client-supplied leftmost entry wins.
+forwarded_allow_ips = os.getenv("FORWARDED_ALLOW_IPS", "127.0.0.1")
+keepalive = 5
+
+# workers read these to pick the cross-process live feed (events.SHARED)
+os.environ["WEB_CONCURRENCY"] = str(workers)
+os.environ.setdefault("LIVE_SHARED", "1" if workers > 1 else "0")
+
+
+def on_starting(server):
+    # schema + default admin once in the master, before any worker forks
+    from app import ensure_default_admin
+    from db import init_db
+
+    init_db()
+    ensure_default_admin()
+    os.environ["APP_INIT_DONE"] = "1"
@@ -1,7 +1,7 @@
 import pandas as pd
 import secrets
 import string
-from db import connect, is_postgres, ph
+from db import connect, is_postgres, ph, bump_versions
 from auth import hash_password
 
 def generate_password(length=10):
@@ -73,6 +73,7 @@ def run_ingest(csv_path: str):
                 "name": name
             })
 
+    bump_versions(cur, "interns", "users")
     conn.commit()
     conn.close()
     return int(len(df)), created_creds
@@ -0,0 +1,56 @@
+import os
+import time
+import socket
+import logging
+import threading
+
+from db import connect, ph
+
+# Periodic background jobs that are safe with several workers/instances.
+# Every worker runs a timer thread, but a job only fires when its row in
+# job_leases can be taken: the lease is held for the whole interval, so the
+# job runs at most once per interval across the fleet and across restarts.
+
+log = logging.getLogger("jobs")
+
+OWNER = f"{socket.gethostname()}:{os.getpid()}"
+
+
+def try_acquire_lease(name: str, hold_sec: float, owner: str = OWNER) -> bool:
+    """Take the named lease if it is free or expired; True when we got it."""
+    now = time.time()
+    conn = connect()
+    cur = conn.cursor()
+    p = ph()
+    cur.execute(f"""
+      INSERT INTO job_leases(name, owner, expires_at) VALUES ({p},{p},{p})
+      ON CONFLICT(name) DO UPDATE SET owner = excluded.owner, expires_at = excluded.expires_at
+      WHERE job_leases.expires_at < {p}
+    """, (name, owner, now + hold_sec, now))
+    got = getattr(cur, "rowcount", 0) == 1
+    conn.commit()
+    conn.close()
+    return got
+
+
+def start_periodic(name: str, interval_sec: float, fn, first_delay_sec: float = 60.0):
+    """Run fn() every interval_sec (fleet-wide) in a daemon thread. 0 disables."""
+    if interval_sec <= 0:
+        return None
+
+    def loop():
+        delay = min(first_delay_sec, interval_sec)
+        while True:
+            time.sleep(delay)
+            delay = min(interval_sec, 300.0)  # re-check often; the lease decides
+            try:
+                if not try_acquire_lease(name, interval_sec):
+                    continue
+                result = fn()
+                log.info("job %s done: %s", name, result)
+            except Exception:
+                log.exception("job %s failed", name)
+
+    t = threading.Thread(target=loop, name=f"job-{name}", daemon=True)
+    t.start()
+    return t
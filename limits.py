@@ -0,0 +1,266 @@
+import os
+import json
+import math
+import time
+import asyncio
+
+from auth import decode_token
+
+# Bulkhead / admission control (pure ASGI middleware).
+# Requests are put into a route class; each class has its own concurrency
+# limit and bounded wait queue, plus a per-user token bucket. When a class is
+# saturated the request is refused right away (503/429 + Retry-After), so a
+# dataset upload or a login burst can't starve cheap reads.
+
+def _env_int(name, default):
+    return int(os.getenv(name, str(default)))
+
+def _env_float(name, default):
+    return float(os.getenv(name, str(default)))
+
+# class -> (max concurrent, max waiting, max wait seconds)
+BULKHEADS = {
+    "heavy": (_env_int("LIMIT_HEAVY_CONCURRENCY", 2), _env_int("LIMIT_HEAVY_QUEUE", 4), _env_float("LIMIT_HEAVY_WAIT_SEC", 30)),
+    "auth": (_env_int("LIMIT_AUTH_CONCURRENCY", 4), _env_int("LIMIT_AUTH_QUEUE", 32), _env_float("LIMIT_AUTH_WAIT_SEC", 5)),
+    "read": (_env_int("LIMIT_READ_CONCURRENCY", 32), _env_int("LIMIT_READ_QUEUE", 256), _env_float("LIMIT_READ_WAIT_SEC", 5)),
+}
+
+# class -> (tokens per second, burst) per user (per client IP when anonymous)
+RATES = {
+    "heavy": (_env_float("RATE_HEAVY_PER_SEC", 0.2), _env_float("RATE_HEAVY_BURST", 3)),
+    "auth": (_env_float("RATE_AUTH_PER_SEC", 1), _env_float("RATE_AUTH_BURST", 10)),
+    "read": (_env_float("RATE_READ_PER_SEC", 20), _env_float("RATE_READ_BURST", 60)),
+}
+
+# /auth/login also has a per-username bucket, charged only by failed logins.
+# It caps guessing against one account from many sources; when it is empty,
+# only clients that have been sending logins themselves (their auth bucket is
+# not full) are refused, so other people can't lock the account owner out.
+LOGIN_USER_RATE = (_env_float("RATE_LOGIN_USER_PER_SEC", 0.2), _env_float("RATE_LOGIN_USER_BURST", 50))
+
+# Retry-After (seconds) when a class queue is full
+RETRY_AFTER = {"heavy": 10, "auth": 2, "read": 1}
+
+HEAVY_ROUTES = {"/admin/dataset/upload", "/admin/export", "/admin/retention/run", "/admin/rollups/refresh"}
+AUTH_ROUTES = {"/auth/login", "/admin/create-supervisor"}
+# never limited: probes, docs and the long-lived SSE stream
+EXEMPT_ROUTES = {"/", "/health", "/docs", "/openapi.json", "/tasks/live"}
+
+
+def route_class(path: str):
+    if path in EXEMPT_ROUTES:
+        return None
+    if path in HEAVY_ROUTES:
+        return "heavy"
+    if path in AUTH_ROUTES:
+        return "auth"
+    return "read"
+
+
+class Bulkhead:
+    def __init__(self, name, limit, max_queue, max_wait):
+        self.name = name
+        self.limit = limit
+        self.max_queue = max_queue
+        self.max_wait = max_wait
+        self._sem = asyncio.Semaphore(limit)
+        self.active = 0
+        self.waiting = 0
+        self.peak_waiting = 0
+        self.admitted = 0
+        self.rejected_full = 0
+        self.rejected_timeout = 0
+        self.rate_limited = 0
+
+    async def acquire(self) -> bool:
+        if self.active >= self.limit and self.waiting >= self.max_queue:
+            self.rejected_full += 1
+            return False
+        self.waiting += 1
+        self.peak_waiting = max(self.peak_waiting, self.waiting)
+        try:
+            await asyncio.wait_for(self._sem.acquire(), timeout=self.max_wait)
+        except asyncio.TimeoutError:
+            self.rejected_timeout += 1
+            return False
+        finally:
+            self.waiting -= 1
+        self.active += 1
+        self.admitted += 1
+        return True
+
+    def release(self):
+        self.active -= 1
+        self._sem.release()
+
+    def stats(self):
+        return {
+            "limit": self.limit,
+            "max_queue": self.max_queue,
+            "active": self.active,
+            "waiting": self.waiting,
+            "peak_waiting": self.peak_waiting,
+            "admitted": self.admitted,
+            "rejected_full": self.rejected_full,
+            "rejected_timeout": self.rejected_timeout,
+            "rate_limited": self.rate_limited,
+        }
+
+
+class TokenBuckets:
+    MAX_KEYS = 20000
+
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self._b = {}  # key -> (tokens, last ts)
+
+    def level(self, key) -> float:
+        """Tokens available right now (burst for an unseen key)."""
+        now = time.monotonic()
+        tokens, ts = self._b.get(key, (self.burst, now))
+        return min(self.burst, tokens + (now - ts) * self.rate)
+
+    def take(self, key) -> float:
+        """0 when allowed, else seconds until a token is available."""
+        now = time.monotonic()
+        tokens, ts = self._b.get(key, (self.burst, now))
+        tokens = min(self.burst, tokens + (now - ts) * self.rate)
+        if tokens >= 1:
+            self._b[key] = (tokens - 1, now)
+            if len(self._b) > self.MAX_KEYS:
+                self._prune(now)
+            return 0.0
+        self._b[key] = (tokens, now)
+        return (1 - tokens) / self.rate if self.rate > 0 else 60.0
+
+    def _prune(self, now):
+        # drop buckets that have refilled completely (idle clients)
+        full = self.burst / self.rate if self.rate > 0 else 0
+        for k in [k for k, (_, ts) in self._b.items() if now - ts > full]:
+            del self._b[k]
+
+
+def _client_key(scope) -> str:
+    for name, value in scope.get("headers") or []:
+        if name == b"authorization":
+            token = value.decode("latin-1").split(" ", 1)[-1]
+            try:
+                return f"user:{decode_token(token)['uid']}"
+            except Exception:
+                break
+    # behind a proxy this is only the real client when uvicorn/gunicorn trust it
+    # (FORWARDED_ALLOW_IPS, see gunicorn.conf.py)
+    client = scope.get("client")
+    return f"ip:{client[0] if client else 'unknown'}"
+
+
+LOGIN_BODY_MAX = 8192
+
+
+async def _login_key(scope, receive):
+    """
+    Per-username rate-limit key for /auth/login, read from the JSON body.
+    Returns (key or None, receive that replays the consumed body).
+    """
+    chunks, size, first = [], 0, None
+    while True:
+        msg = await receive()
+        if msg["type"] != "http.request":
+            first = msg
+            break
+        chunks.append(msg.get("body", b""))
+        size += len(chunks[-1])
+        more = msg.get("more_body", False)
+        if not more or size > LOGIN_BODY_MAX:
+            body = b"".join(chunks)
+            first = {"type": "http.request", "body": body, "more_body": more}
+            break
+
+    key = None
+    if first["type"] == "http.request" and not first["more_body"]:
+        try:
+            username = json.loads(first["body"]).get("username")
+            if isinstance(username, str) and username.strip():
+                key = f"login:{username.strip().lower()}"
+        except Exception:
+            pass
+
+    pending = [first]
+
+    async def replay():
+        if pending:
+            return pending.pop()
+        return await receive()
+
+    return key, replay
+
+
+async def _refuse(send, status, retry_after, detail):
+    body = json.dumps({"detail": detail}).encode()
+    await send({
+        "type": "http.response.start",
+        "status": status,
+        "headers": [
+            (b"content-type", b"application/json"),
+            (b"retry-after", str(max(1, math.ceil(retry_after))).encode()),
+        ],
+    })
+    await send({"type": "http.response.body", "body": body})
+
+
+class BulkheadMiddleware:
+    def __init__(self, app):
+        self.app = app
+        self.bulkheads = {name: Bulkhead(name, *cfg) for name, cfg in BULKHEADS.items()}
+        self.buckets = {name: TokenBuckets(*cfg) for name, cfg in RATES.items()}
+        self.login_users = TokenBuckets(*LOGIN_USER_RATE)
+        LIMITERS.append(self)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] == "OPTIONS":
+            return await self.app(scope, receive, send)
+        cls = route_class(scope["path"])
+        if cls is None:
+            return await self.app(scope, receive, send)
+
+        user_key = None
+        if scope["path"] == "/auth/login" and scope["method"] == "POST":
+            user_key, receive = await _login_key(scope, receive)
+
+        bh = self.bulkheads[cls]
+        buckets = self.buckets[cls]
+        client_key = _client_key(scope)
+        client_idle = buckets.level(client_key) >= buckets.burst
+        wait = buckets.take(client_key)
+        if wait == 0 and user_key and not client_idle and self.login_users.level(user_key) < 1:
+            wait = (1 - self.login_users.level(user_key)) / self.login_users.rate if self.login_users.rate > 0 else 60.0
+        if wait > 0:
+            bh.rate_limited += 1
+            return await _refuse(send, 429, wait, "Rate limit exceeded")
+
+        if user_key:
+            inner_send = send
+
+            async def send(message):
+                if message["type"] == "http.response.start" and message["status"] == 401:
+                    self.login_users.take(user_key)
+                await inner_send(message)
+
+        if not await bh.acquire():
+            return await _refuse(send, 503, RETRY_AFTER[cls], f"Server busy ({cls})")
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            bh.release()
+
+    def stats(self):
+        return {name: bh.stats() for name, bh in self.bulkheads.items()}
+
+
+# middleware instances (Starlette builds the stack lazily) for /admin/limits
+LIMITERS = []
+
+
+def limits_stats():
+    return LIMITERS[-1].stats() if LIMITERS else {}
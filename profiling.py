@@ -0,0 +1,325 @@
+import os
+import sys
+import time
+import uuid
+import asyncio
+import threading
+import contextvars
+from collections import OrderedDict
+
+from auth import decode_token
+
+# On-demand per-request profiling for admins.
+# Trigger: admin JWT + (`X-Profile: 1` header or `?__profile=1`). The request
+# is sampled (sys._current_frames on the event-loop thread while the request's
+# own task is the one running, and on each threadpool thread while it runs a
+# call made for the request) and every SQL statement is timed; the result is kept
+# in memory and fetched from GET /admin/profiles/{id} as speedscope JSON or
+# collapsed stacks. Sampling stops after PROFILE_MAX_SAMPLES samples or
+# PROFILE_MAX_SEC, and streaming routes are refused.
+# Untriggered requests only pay a header/query-string check.
+
+PROFILE_INTERVAL_MS = float(os.getenv("PROFILE_INTERVAL_MS", "2"))
+PROFILE_KEEP = int(os.getenv("PROFILE_KEEP", "20"))
+PROFILE_MAX_SAMPLES = int(os.getenv("PROFILE_MAX_SAMPLES", "5000"))
+PROFILE_MAX_SEC = float(os.getenv("PROFILE_MAX_SEC", "30"))
+PROFILE_MAX_SQL = int(os.getenv("PROFILE_MAX_SQL", "2000"))
+
+# long-lived responses: a profile would never finish
+STREAMING_ROUTES = {"/tasks/live", "/admin/export"}
+TRUTHY = {b"1", b"true", b"yes", b"on"}
+
+APP_DIR = os.path.dirname(os.path.abspath(__file__))
+_THIS_FILE = os.path.abspath(__file__)
+
+_session = contextvars.ContextVar("profile_session", default=None)
+PROFILES = OrderedDict()
+_profiles_lock = threading.Lock()
+
+
+class ProfileSession:
+    def __init__(self, method, path):
+        self.id = uuid.uuid4().hex[:12]
+        self.method = method
+        self.path = path
+        self.started = time.time()
+        self.duration_ms = 0.0
+        self.status = None
+        self.threads = {}  # pool thread id -> calls running for this request
+        self.loop = None
+        self.loop_tid = None
+        self.task = None
+        self.samples = []  # stacks, root first: tuple of (name, file, line)
+        self.sql = []
+        self.truncated = False
+        self.done = threading.Event()
+        self._lock = threading.Lock()
+
+    # ---------- sampling ----------
+    def enter(self, tid):
+        with self._lock:
+            self.threads[tid] = self.threads.get(tid, 0) + 1
+
+    def leave(self, tid):
+        # pool threads are reused by other requests once the call returns
+        with self._lock:
+            n = self.threads.get(tid, 0) - 1
+            if n > 0:
+                self.threads[tid] = n
+            else:
+                self.threads.pop(tid, None)
+
+    def _sample_loop(self, interval):
+        me = threading.get_ident()
+        deadline = time.monotonic() + PROFILE_MAX_SEC
+        while not self.done.is_set():
+            if len(self.samples) >= PROFILE_MAX_SAMPLES or time.monotonic() > deadline:
+                self.truncated = True
+                return
+            with self._lock:
+                threads = set(self.threads)
+            # the loop thread counts only while our task (not another request's) runs on it
+            if self.loop_tid is not None and asyncio.current_task(self.loop) is self.task:
+                threads.add(self.loop_tid)
+            for tid, frame in sys._current_frames().items():
+                if tid == me or tid not in threads:
+                    continue
+                stack = []
+                in_app = False
+                f = frame
+                while f is not None:
+                    code = f.f_code
+                    fn = code.co_filename
+                    if fn.startswith(APP_DIR) and fn != _THIS_FILE:
+                        in_app = True
+                    stack.append((code.co_name, fn, code.co_firstlineno))
+                    f = f.f_back
+                # idle pool threads / other requests' loop work carry no app frames
+                if in_app:
+                    stack.reverse()
+                    self.samples.append(tuple(stack))
+            self.done.wait(interval)
+
+    def start(self):
+        t = threading.Thread(target=self._sample_loop, args=(PROFILE_INTERVAL_MS / 1000.0,),
+                             name=f"profiler-{self.id}", daemon=True)
+        t.start()
+        return t
+
+    # ---------- output ----------
+    def summary(self):
+        return {
+            "id": self.id,
+            "method": self.method,
+            "path": self.path,
+            "status": self.status,
+            "duration_ms": round(self.duration_ms, 2),
+            "samples": len(self.samples),
+            "truncated": self.truncated,
+            "interval_ms": PROFILE_INTERVAL_MS,
+            "sql_count": len(self.sql),
+            "sql_ms": round(sum(q["ms"] for q in self.sql), 2),
+            "sql": self.sql,
+        }
+
+    def collapsed(self) -> str:
+        """Brendan Gregg collapsed stacks (flamegraph.pl / speedscope import)."""
+        counts = {}
+        for stack in self.samples:
+            key = ";".join(f"{name} ({os.path.basename(fn)}:{line})" for name, fn, line in stack)
+            counts[key] = counts.get(key, 0) + 1
+        return "".join(f"{k} {v}\n" for k, v in sorted(counts.items()))
+
+    def speedscope(self) -> dict:
+        frames, index = [], {}
+        samples = []
+        for stack in self.samples:
+            ids = []
+            for fr in stack:
+                if fr not in index:
+                    index[fr] = len(frames)
+                    frames.append({"name": fr[0], "file": fr[1], "line": fr[2]})
+                ids.append(index[fr])
+            samples.append(ids)
+        return {
+            "$schema": "https://www.speedscope.app/file-format-schema.json",
+            "shared": {"frames": frames},
+            "profiles": [{
+                "type": "sampled",
+                "name": f"{self.method} {self.path}",
+                "unit": "milliseconds",
+                "startValue": 0,
+                "endValue": round(self.duration_ms, 3),
+                "samples": samples,
+                "weights": [PROFILE_INTERVAL_MS] * len(samples),
+            }],
+            "name": f"{self.method} {self.path} ({self.id})",
+            "exporter": "ai-clone-profiler",
+        }
+
+
+# ---------- SQL tracing (db.connect wraps connections while a session is active) ----------
+class _TracingCursor:
+    def __init__(self, cur, session):
+        object.__setattr__(self, "_cur", cur)
+        object.__setattr__(self, "_session", session)
+
+    def execute(self, sql, params=None):
+        t0 = time.perf_counter()
+        try:
+            if params is None:
+                self._cur.execute(sql)
+            else:
+                self._cur.execute(sql, params)
+        finally:
+            if len(self._session.sql) < PROFILE_MAX_SQL:
+                self._session.sql.append({
+                    "sql": " ".join(str(sql).split()),
+                    "params": len(params or ()),
+                    "ms": round((time.perf_counter() - t0) * 1000, 3),
+                })
+            else:
+                self._session.truncated = True
+        return self
+
+    def __iter__(self):
+        return iter(self._cur)
+
+    def __getattr__(self, name):
+        return getattr(self._cur, name)
+
+    def __setattr__(self, name, value):
+        setattr(self._cur, name, value)
+
+
+class _TracingConnection:
+    def __init__(self, conn, session):
+        self._conn = conn
+        self._session = session
+
+    def cursor(self, *args, **kwargs):
+        return _TracingCursor(self._conn.cursor(*args, **kwargs), self._session)
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+
+def traced(conn):
+    """Called by db.connect(): a no-op unless the current request is being profiled."""
+    session = _session.get()
+    if session is None:
+        return conn
+    return _TracingConnection(conn, session)
+
+
+# ---------- threadpool registration ----------
+# Sync endpoints, dependencies and run_in_threadpool calls all go through
+# anyio.to_thread.run_sync, which carries the request's context into the pool
+# thread; wrapping it marks that thread as ours for the duration of the call.
+_hook_installed = False
+
+
+def _install_threadpool_hook():
+    global _hook_installed
+    if _hook_installed:
+        return
+    import anyio.to_thread
+
+    run_sync = anyio.to_thread.run_sync
+
+    async def run_sync_profiled(func, *args, **kwargs):
+        session = _session.get()
+        if session is None:
+            return await run_sync(func, *args, **kwargs)
+
+        def call(*a):
+            tid = threading.get_ident()
+            session.enter(tid)
+            try:
+                return func(*a)
+            finally:
+                session.leave(tid)
+
+        return await run_sync(call, *args, **kwargs)
+
+    anyio.to_thread.run_sync = run_sync_profiled
+    _hook_installed = True
+
+
+# ---------- middleware ----------
+def _wants_profile(scope) -> bool:
+    for part in scope.get("query_string", b"").split(b"&"):
+        if part.startswith(b"__profile="):
+            return part[len(b"__profile="):].lower() in TRUTHY
+    for name, value in scope.get("headers") or []:
+        if name == b"x-profile":
+            return value.strip().lower() in TRUTHY
+    return False
+
+
+def _is_admin(scope) -> bool:
+    for name, value in scope.get("headers") or []:
+        if name == b"authorization":
+            try:
+                return decode_token(value.decode("latin-1").split(" ", 1)[-1]).get("role") == "admin"
+            except Exception:
+                return False
+    return False
+
+
+class ProfilingMiddleware:
+    def __init__(self, app):
+        self.app = app
+        _install_threadpool_hook()
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not _wants_profile(scope) or not _is_admin(scope):
+            return await self.app(scope, receive, send)
+
+        if scope["path"] in STREAMING_ROUTES:
+            await send({"type": "http.response.start", "status": 400,
+                        "headers": [(b"content-type", b"application/json")]})
+            await send({"type": "http.response.body",
+                        "body": b'{"detail":"Profiling is not available for streaming routes"}'})
+            return
+
+        session = ProfileSession(scope["method"], scope["path"])
+        session.loop = asyncio.get_running_loop()
+        session.loop_tid = threading.get_ident()
+        session.task = asyncio.current_task()
+
+        async def send_with_id(message):
+            if message["type"] == "http.response.start":
+                session.status = message["status"]
+                message = dict(message)
+                message["headers"] = list(message.get("headers") or []) + [
+                    (b"x-profile-id", session.id.encode()),
+                ]
+            await send(message)
+
+        token = _session.set(session)
+        session.start()
+        t0 = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_id)
+        finally:
+            session.duration_ms = (time.perf_counter() - t0) * 1000
+            session.done.set()
+            _session.reset(token)
+            with _profiles_lock:
+                PROFILES[session.id] = session
+                while len(PROFILES) > PROFILE_KEEP:
+                    PROFILES.popitem(last=False)
+
+
+def get_profile(profile_id: str):
+    with _profiles_lock:
+        return PROFILES.get(profile_id)
+
+
+def list_profiles():
+    with _profiles_lock:
+        return [
+            {k: v for k, v in s.summary().items() if k != "sql"}
+            for s in reversed(PROFILES.values())
+        ]
@@ -0,0 +1,256 @@
+import os
+import time
+import heapq
+import logging
+import threading
+from datetime import datetime, timezone
+
+from db import connect, ph, row_to_dict
+from events import hub
+from mailer import send_email
+
+# Due-date reminders for open tasks.
+# One scheduler thread per process keeps a min-heap of upcoming fire times
+# ('soon' = due - REMINDER_LEAD_SEC, 'overdue' = due). The heap is filled a
+# window at a time through idx_tasks_status_due, so the thread only touches
+# the DB when the window moves or a reminder is actually due. Every reminder
+# is claimed in task_reminders (PK task_id, kind) before it goes out, so
+# restarts and other workers never send it twice.
+
+REMINDER_LEAD_SEC = int(os.getenv("REMINDER_LEAD_SEC", str(24 * 3600)))
+REMINDER_WINDOW_SEC = int(os.getenv("REMINDER_WINDOW_SEC", str(24 * 3600)))
+REMINDER_REFILL_SEC = int(os.getenv("REMINDER_REFILL_SEC", "300"))  # also picks up other workers' new tasks
+REMINDER_MAX_OVERDUE_DAYS = int(os.getenv("REMINDER_MAX_OVERDUE_DAYS", "7"))
+REMINDER_EMAILS = os.getenv("REMINDER_EMAILS", "0") == "1"
+REMINDERS_ENABLED = os.getenv("REMINDERS", "1") == "1"
+
+OPEN_STATUSES = ("todo", "in_progress")
+DATE_FMT = "%Y-%m-%d %H:%M:%S"
+
+log = logging.getLogger("reminders")
+
+
+def due_ts(value):
+    """due_date (TEXT or TIMESTAMP) -> epoch seconds; naive = UTC, date-only = midnight (as Postgres casts it)."""
+    if value is None or value == "":
+        return None
+    if isinstance(value, datetime):
+        dt = value
+    else:
+        s = str(value).strip().replace("Z", "+00:00")
+        try:
+            dt = datetime.fromisoformat(s)
+        except ValueError:
+            return None
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)
+    return dt.timestamp()
+
+
+def _fmt(ts) -> str:
+    return datetime.fromtimestamp(ts, timezone.utc).strftime(DATE_FMT)
+
+
+class ReminderScheduler:
+    def __init__(self):
+        self._heap = []         # (fire_ts, task_id, kind, due_ts)
+        self._queued = set()    # (task_id, kind) currently in the heap
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread = None
+        self._horizon = None    # due dates below this have been loaded
+        self._max_id = 0        # highest task id seen by a window load
+        self._next_refill = 0.0
+        self.sent = 0
+        self.skipped = 0
+
+    # ---------- heap ----------
+    def _push(self, task_id, due, now):
+        """Queue the reminders still ahead of (or just past) `now` for one task."""
+        if due < now - REMINDER_MAX_OVERDUE_DAYS * 86400:
+            return  # long overdue before we ever saw it: don't start nagging now
+        for kind, fire in (("soon", due - REMINDER_LEAD_SEC), ("overdue", due)):
+            if kind == "soon" and due <= now:
+                continue  # already overdue: only the overdue reminder applies
+            if (task_id, kind) in self._queued:
+                continue
+            self._queued.add((task_id, kind))
+            heapq.heappush(self._heap, (fire, task_id, kind, due))
+
+    def notify(self, task_id, due_date):
+        """Called after a task is created or reopened; queues it now if its due date is inside the loaded window."""
+        due = due_ts(due_date)
+        if due is None or self._thread is None:
+            return
+        with self._lock:
+            if self._horizon is None or due >= self._horizon:
+                return  # a later window load will pick it up
+            self._push(task_id, due, time.time())
+        self._wake.set()
+
+    # ---------- loading ----------
+    def _load(self, cur, now):
+        """Extend the loaded window to now + lead + window; also pick up tasks created elsewhere."""
+        p = ph()
+        statuses = ",".join([p] * len(OPEN_STATUSES))
+        new_horizon = now + REMINDER_LEAD_SEC + REMINDER_WINDOW_SEC
+        oldest = now - REMINDER_MAX_OVERDUE_DAYS * 86400
+        lo = self._horizon if self._horizon is not None else oldest
+
+        # read before the window query so a concurrent insert is seen by the next id scan
+        cur.execute("SELECT MAX(id) AS m FROM tasks")
+        max_id = (row_to_dict(cur.fetchone()) or {}).get("m") or 0
+
+        # one day of slack each side: TEXT due dates may be date-only or use 'T'
+        cur.execute(f"""
+          SELECT t.id, t.due_date FROM tasks t
+          WHERE t.status IN ({statuses}) AND t.due_date >= {p} AND t.due_date < {p}
+            AND NOT EXISTS (SELECT 1 FROM task_reminders r WHERE r.task_id = t.id AND r.kind = 'overdue')
+        """, (*OPEN_STATUSES, _fmt(lo - 86400), _fmt(new_horizon + 86400)))
+        rows = [row_to_dict(r) for r in cur.fetchall()]
+
+        # tasks created by other workers inside the already-loaded window
+        if self._horizon is not None:
+            cur.execute(f"""
+              SELECT t.id, t.due_date FROM tasks t
+              WHERE t.id > {p} AND t.status IN ({statuses}) AND t.due_date IS NOT NULL
+            """, (self._max_id, *OPEN_STATUSES))
+            rows += [row_to_dict(r) for r in cur.fetchall()]
+
+        with self._lock:
+            for r in rows:
+                due = due_ts(r["due_date"])
+                if due is not None and due < new_horizon:
+                    self._push(r["id"], due, now)
+            self._horizon = new_horizon
+            self._max_id = max(self._max_id, max_id)
+        self._next_refill = now + min(REMINDER_REFILL_SEC, REMINDER_WINDOW_SEC)
+
+    # ---------- firing ----------
+    def _pop_due(self, now):
+        out = []
+        with self._lock:
+            while self._heap and self._heap[0][0] <= now:
+                fire, task_id, kind, due = heapq.heappop(self._heap)
+                self._queued.discard((task_id, kind))
+                out.append((task_id, kind, due))
+        return out
+
+    def _fire(self, cur, conn, due_items, now):
+        """Claim and send a batch of reminders; one message per recipient."""
+        p = ph()
+        ids = sorted({t for t, _, _ in due_items})
+        cur.execute(f"""
+          SELECT t.id, t.title, t.status, t.due_date, t.assigned_to_user_id, t.assigned_by_user_id
+          FROM tasks t WHERE t.id IN ({",".join([p] * len(ids))})
+        """, ids)
+        tasks = {r["id"]: r for r in (row_to_dict(x) for x in cur.fetchall())}
+
+        claimed = []
+        for task_id, kind, due in due_items:
+            t = tasks.get(task_id)
+            # done, re-dated, or a 'soon' that only fired after the deadline
+            if (not t or t["status"] not in OPEN_STATUSES or due_ts(t["due_date"]) != due
+                    or (kind == "soon" and now >= due)):
+                self.skipped += 1
+                continue
+            cur.execute(f"""
+              INSERT INTO task_reminders(task_id, kind) VALUES ({p},{p})
+              ON CONFLICT(task_id, kind) DO NOTHING
+            """, (task_id, kind))
+            if getattr(cur, "rowcount", 0) == 1:
+                claimed.append((t, kind))
+        conn.commit()
+        if not claimed:
+            return 0
+
+        # soon -> assignee; overdue -> assignee + assigner
+        by_user = {}
+        for t, kind in claimed:
+            by_user.setdefault(t["assigned_to_user_id"], []).append((t, kind))
+            if kind == "overdue":
+                by_user.setdefault(t["assigned_by_user_id"], []).append((t, kind))
+
+        for t, kind in claimed:
+            hub.publish("task_reminder", {"task_id": t["id"], "title": t["title"], "kind": kind,
+                                          "due_date": t["due_date"]},
+                        t["assigned_to_user_id"], t["assigned_by_user_id"])
+
+        if REMINDER_EMAILS:
+            self._send_emails(cur, by_user)
+        self.sent += len(claimed)
+        return len(claimed)
+
+    def _send_emails(self, cur, by_user):
+        p = ph()
+        uids = list(by_user)
+        cur.execute(f"""
+          SELECT u.id, u.username, u.full_name, i.email
+          FROM users u LEFT JOIN interns i ON i.id_info = u.intern_id_info
+          WHERE u.id IN ({",".join([p] * len(uids))})
+        """, uids)
+        for u in (row_to_dict(r) for r in cur.fetchall()):
+            to = u.get("email") or (u["username"] if "@" in (u["username"] or "") else None)
+            if not to:
+                continue
+            items = by_user[u["id"]]
+            lines = [
+                f"- [{'OVERDUE' if kind == 'overdue' else 'due soon'}] {t['title']} (task #{t['id']}, due {t['due_date']})"
+                for t, kind in items
+            ]
+            body = f"Hi {u.get('full_name') or u['username']},\n\nTask reminders:\n" + "\n".join(lines) + "\n"
+            try:
+                send_email(to, f"{len(items)} task reminder(s)", body)
+            except Exception:
+                # already claimed: a reminder is sent at most once
+                log.exception("reminder email to %s failed", to)
+
+    # ---------- thread ----------
+    def _loop(self):
+        while True:
+            now = time.time()
+            try:
+                if now >= self._next_refill:
+                    conn = connect()
+                    self._load(conn.cursor(), now)
+                    conn.close()
+
+                batch = self._pop_due(now)
+                if batch:
+                    conn = connect()
+                    try:
+                        self._fire(conn.cursor(), conn, batch, now)
+                    finally:
+                        conn.close()
+            except Exception:
+                log.exception("reminder scheduler iteration failed")
+                self._next_refill = now + REMINDER_REFILL_SEC
+
+            with self._lock:
+                next_fire = self._heap[0][0] if self._heap else float("inf")
+            timeout = max(0.0, min(next_fire, self._next_refill) - time.time())
+            self._wake.wait(timeout)
+            self._wake.clear()
+
+    def start(self):
+        if self._thread is not None or not REMINDERS_ENABLED:
+            return self._thread
+        self._thread = threading.Thread(target=self._loop, name="reminders", daemon=True)
+        self._thread.start()
+        return self._thread
+
+    def stats(self) -> dict:
+        with self._lock:
+            nxt = self._heap[0] if self._heap else None
+            return {
+                "enabled": REMINDERS_ENABLED and self._thread is not None,
+                "queued": len(self._heap),
+                "next": {"task_id": nxt[1], "kind": nxt[2], "at": _fmt(nxt[0])} if nxt else None,
+                "loaded_until": _fmt(self._horizon) if self._horizon else None,
+                "sent": self.sent,
+                "skipped": self.skipped,
+                "emails": REMINDER_EMAILS,
+            }
+
+
+scheduler = ReminderScheduler()
@@ -0,0 +1,108 @@
+import os
+from datetime import datetime, timedelta
+
+from db import connect, ph, row_to_dict, bump_versions
+
+# Retention for the append-only history tables.
+# - task_updates older than RETENTION_DAYS move to task_updates_archive
+#   (still served by GET /tasks/{id}/updates?include_archived=true)
+# - optionally, old rag_records are condensed into one 'summary' record per intern
+
+RETENTION_DAYS = int(os.getenv("RETENTION_DAYS", "90"))
+RETENTION_INTERVAL_SEC = int(os.getenv("RETENTION_INTERVAL_SEC", "86400"))  # 0 = no scheduled runs
+RETENTION_BATCH = int(os.getenv("RETENTION_BATCH", "1000"))
+RAG_COMPACT = os.getenv("RAG_COMPACT", "0") == "1"
+RAG_COMPACT_MIN_RECORDS = int(os.getenv("RAG_COMPACT_MIN_RECORDS", "5"))
+RAG_SUMMARY_MAX_CHARS = int(os.getenv("RAG_SUMMARY_MAX_CHARS", "4000"))
+
+
+def _cutoff(days: int) -> str:
+    # same text format as SQLite datetime('now'); Postgres casts it to TIMESTAMP
+    return (datetime.utcnow() - timedelta(days=days)).strftime("%Y-%m-%d %H:%M:%S")
+
+
+def archive_task_updates(older_than_days: int = RETENTION_DAYS, batch: int = RETENTION_BATCH) -> int:
+    """Move old task_updates into the archive in small transactions. Returns rows moved."""
+    cutoff = _cutoff(older_than_days)
+    p = ph()
+    moved = 0
+
+    conn = connect()
+    cur = conn.cursor()
+    while True:
+        cur.execute(f"SELECT id FROM task_updates WHERE created_at < {p} ORDER BY id LIMIT {p}", (cutoff, batch))
+        ids = [row_to_dict(r)["id"] for r in cur.fetchall()]
+        if not ids:
+            break
+
+        in_list = ",".join([p] * len(ids))
+        cur.execute(f"""
+          INSERT INTO task_updates_archive(id, task_id, intern_user_id, message, created_at)
+          SELECT id, task_id, intern_user_id, message, created_at
+          FROM task_updates WHERE id IN ({in_list})
+        """, ids)
+        cur.execute(f"DELETE FROM task_updates WHERE id IN ({in_list})", ids)
+        bump_versions(cur, "task_updates")
+        conn.commit()
+        moved += len(ids)
+
+        if len(ids) < batch:
+            break
+    conn.close()
+    return moved
+
+
+def compact_rag_records(older_than_days: int = RETENTION_DAYS,
+                        min_records: int = RAG_COMPACT_MIN_RECORDS,
+                        max_chars: int = RAG_SUMMARY_MAX_CHARS) -> int:
+    """Fold old rag_records into one condensed 'summary' record per intern. Returns rows removed."""
+    cutoff = _cutoff(older_than_days)
+    p = ph()
+    removed = 0
+
+    conn = connect()
+    cur = conn.cursor()
+    cur.execute(f"""
+      SELECT intern_id_info, COUNT(*) AS c
+      FROM rag_records
+      WHERE created_at < {p}
+      GROUP BY intern_id_info
+      HAVING COUNT(*) >= {p}
+    """, (cutoff, min_records))
+    interns = [row_to_dict(r)["intern_id_info"] for r in cur.fetchall()]
+
+    for intern_id in interns:
+        cur.execute(f"""
+          SELECT id, record_type, text FROM rag_records
+          WHERE intern_id_info={p} AND created_at < {p}
+          ORDER BY id
+        """, (intern_id, cutoff))
+        rows = [row_to_dict(r) for r in cur.fetchall()]
+
+        # de-duplicate, keep order, cap size (newest text wins when trimming)
+        seen, parts = set(), []
+        for r in rows:
+            t = (r["text"] or "").strip()
+            if t and t not in seen:
+                seen.add(t)
+                parts.append(t)
+        summary = "\n".join(parts)
+        if len(summary) > max_chars:
+            summary = summary[-max_chars:]
+
+        ids = [r["id"] for r in rows]
+        cur.execute(f"INSERT INTO rag_records(intern_id_info, record_type, text) VALUES ({p},'summary',{p})",
+                    (intern_id, summary))
+        cur.execute(f"DELETE FROM rag_records WHERE id IN ({','.join([p] * len(ids))})", ids)
+        conn.commit()
+        removed += len(ids)
+
+    conn.close()
+    return removed
+
+
+def run_retention() -> dict:
+    out = {"task_updates_archived": archive_task_updates()}
+    if RAG_COMPACT:
+        out["rag_records_compacted"] = compact_rag_records()
+    return out
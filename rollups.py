@@ -0,0 +1,243 @@
+import os
+from datetime import datetime, timedelta
+
+from db import connect, ph, row_to_dict, bump_versions
+
+# Incremental day/week rollups behind /analytics/trends/*.
+# Each source is folded in from a high-water mark kept in rollup_state, so a
+# refresh only reads rows added since the last run. Rows younger than
+# ROLLUP_LAG_SEC are left for the next run (late commits can't be skipped).
+
+ROLLUP_INTERVAL_SEC = int(os.getenv("ROLLUP_INTERVAL_SEC", "300"))  # 0 = no scheduled runs
+ROLLUP_LAG_SEC = int(os.getenv("ROLLUP_LAG_SEC", "60"))
+ROLLUP_BATCH = int(os.getenv("ROLLUP_BATCH", "5000"))
+
+PERIODS = ("day", "week")
+DONE_BINS_HOURS = [24, 72, 168, 336, 720]
+DONE_LABELS = ["<1d", "1-3d", "3-7d", "7-14d", "14-30d", ">30d"]
+
+
+def _get_hwm(cur, name, default):
+    p = ph()
+    cur.execute(f"SELECT hwm FROM rollup_state WHERE name={p}", (name,))
+    r = row_to_dict(cur.fetchone())
+    return r["hwm"] if r else default
+
+
+def _set_hwm(cur, name, value):
+    p = ph()
+    cur.execute(f"""
+      INSERT INTO rollup_state(name, hwm) VALUES ({p},{p})
+      ON CONFLICT(name) DO UPDATE SET hwm = excluded.hwm
+    """, (name, str(value)))
+
+
+def _buckets(ts):
+    """datetime Series -> {period: 'YYYY-MM-DD' bucket start} (weeks start Monday)."""
+    return {
+        "day": ts.dt.floor("D").dt.strftime("%Y-%m-%d"),
+        "week": ts.dt.to_period("W-SUN").dt.start_time.dt.strftime("%Y-%m-%d"),
+    }
+
+
+def _settled(rows, cutoff, col="created_at"):
+    # id order: stop at the first row still inside the lag window
+    out = []
+    for r in rows:
+        if str(r[col]) >= cutoff:
+            break
+        out.append(r)
+    return out
+
+
+def _fold_feedback(cur, cutoff, batch):
+    p = ph()
+    hwm = int(_get_hwm(cur, "feedback_id", "0"))
+    cur.execute(f"""
+      SELECT id, intern_id_info, rating, created_at FROM supervisor_feedback
+      WHERE id > {p} ORDER BY id LIMIT {p}
+    """, (hwm, batch))
+    rows = _settled([row_to_dict(r) for r in cur.fetchall()], cutoff)
+    if not rows:
+        return 0
+
+    import pandas as pd
+    df = pd.DataFrame(rows)
+    df = df[df["rating"].notna()]
+    if len(df):
+        ts = pd.to_datetime(df["created_at"].astype(str))
+        for period, bucket in _buckets(ts).items():
+            g = df.assign(bucket=bucket.values).groupby(["bucket", "intern_id_info"])["rating"].agg(["sum", "count"])
+            cur.executemany(f"""
+              INSERT INTO rollup_feedback(period, bucket_start, intern_id_info, rating_sum, rating_count)
+              VALUES ({p},{p},{p},{p},{p})
+              ON CONFLICT(period, bucket_start, intern_id_info) DO UPDATE SET
+                rating_sum = rollup_feedback.rating_sum + excluded.rating_sum,
+                rating_count = rollup_feedback.rating_count + excluded.rating_count
+            """, [(period, b, i, float(r["sum"]), int(r["count"])) for (b, i), r in g.iterrows()])
+
+    _set_hwm(cur, "feedback_id", rows[-1]["id"])
+    return len(rows)
+
+
+def _fold_created(cur, cutoff, batch):
+    p = ph()
+    hwm = int(_get_hwm(cur, "tasks_id", "0"))
+    cur.execute(f"SELECT id, created_at FROM tasks WHERE id > {p} ORDER BY id LIMIT {p}", (hwm, batch))
+    rows = _settled([row_to_dict(r) for r in cur.fetchall()], cutoff)
+    if not rows:
+        return 0
+
+    import pandas as pd
+    ts = pd.to_datetime(pd.Series([str(r["created_at"]) for r in rows]))
+    for period, bucket in _buckets(ts).items():
+        counts = bucket.value_counts()
+        cur.executemany(f"""
+          INSERT INTO rollup_tasks(period, bucket_start, created) VALUES ({p},{p},{p})
+          ON CONFLICT(period, bucket_start) DO UPDATE SET created = rollup_tasks.created + excluded.created
+        """, [(period, b, int(n)) for b, n in counts.items()])
+
+    _set_hwm(cur, "tasks_id", rows[-1]["id"])
+    return len(rows)
+
+
+def _fold_completed(cur, cutoff):
+    p = ph()
+    hwm = _get_hwm(cur, "tasks_completed_at", "1970-01-01 00:00:00")
+    # no LIMIT: a batch boundary could split rows sharing one completed_at
+    cur.execute(f"""
+      SELECT t.id, t.created_at, t.completed_at, d.task_id AS folded FROM tasks t
+      LEFT JOIN rollup_done d ON d.task_id = t.id
+      WHERE t.completed_at > {p} AND t.completed_at < {p}
+      ORDER BY t.completed_at
+    """, (hwm, cutoff))
+    rows = [row_to_dict(r) for r in cur.fetchall()]
+    if not rows:
+        return 0
+
+    # reopened and completed again: only the first completion counts
+    fresh = [r for r in rows if r["folded"] is None]
+    _set_hwm(cur, "tasks_completed_at", str(rows[-1]["completed_at"]))
+    if not fresh:
+        return 0
+    cur.executemany(f"INSERT INTO rollup_done(task_id) VALUES ({p})", [(r["id"],) for r in fresh])
+
+    import numpy as np
+    import pandas as pd
+    df = pd.DataFrame(fresh)
+    created = pd.to_datetime(df["created_at"].astype(str))
+    done = pd.to_datetime(df["completed_at"].astype(str))
+    hours = ((done - created).dt.total_seconds() / 3600.0).clip(lower=0).to_numpy()
+    labels = np.array(DONE_LABELS)[np.digitize(hours, DONE_BINS_HOURS)]
+    df = df.assign(hours=hours, range_label=labels)
+
+    for period, bucket in _buckets(done).items():
+        d = df.assign(bucket=bucket.values)
+        g = d.groupby("bucket")["hours"].agg(["count", "sum"])
+        cur.executemany(f"""
+          INSERT INTO rollup_tasks(period, bucket_start, completed, done_hours_sum) VALUES ({p},{p},{p},{p})
+          ON CONFLICT(period, bucket_start) DO UPDATE SET
+            completed = rollup_tasks.completed + excluded.completed,
+            done_hours_sum = rollup_tasks.done_hours_sum + excluded.done_hours_sum
+        """, [(period, b, int(r["count"]), float(r["sum"])) for b, r in g.iterrows()])
+
+        h = d.groupby(["bucket", "range_label"]).size()
+        cur.executemany(f"""
+          INSERT INTO rollup_time_to_done(period, bucket_start, range_label, count) VALUES ({p},{p},{p},{p})
+          ON CONFLICT(period, bucket_start, range_label) DO UPDATE SET count = rollup_time_to_done.count + excluded.count
+        """, [(period, b, lbl, int(n)) for (b, lbl), n in h.items()])
+
+    return len(fresh)
+
+
+def refresh_rollups(batch: int = ROLLUP_BATCH) -> dict:
+    """Fold new feedback/tasks/completions into the rollups. Each step commits with its hwm."""
+    # pandas/NumPy are imported by the fold steps only once they have rows
+    cutoff = (datetime.utcnow() - timedelta(seconds=ROLLUP_LAG_SEC)).strftime("%Y-%m-%d %H:%M:%S")
+    stats = {"feedback": 0, "tasks_created": 0, "tasks_completed": 0}
+
+    conn = connect()
+    cur = conn.cursor()
+    for key, step in (("feedback", _fold_feedback), ("tasks_created", _fold_created)):
+        while True:
+            n = step(cur, cutoff, batch)
+            if n:
+                bump_versions(cur, "rollups")
+            conn.commit()
+            stats[key] += n
+            if n < batch:
+                break
+
+    stats["tasks_completed"] = _fold_completed(cur, cutoff)
+    if stats["tasks_completed"]:
+        bump_versions(cur, "rollups")
+    conn.commit()
+    conn.close()
+    return stats
+
+
+# ---------- readers (rollup tables only) ----------
+def feedback_trend(period: str, intern_id=None):
+    p = ph()
+    sql = f"""
+      SELECT bucket_start, intern_id_info, rating_sum, rating_count
+      FROM rollup_feedback WHERE period={p}
+    """
+    params = [period]
+    if intern_id:
+        sql += f" AND intern_id_info={p}"
+        params.append(intern_id)
+    sql += " ORDER BY bucket_start, intern_id_info"
+
+    conn = connect(readonly=True)
+    cur = conn.cursor()
+    cur.execute(sql, params)
+    rows = [row_to_dict(r) for r in cur.fetchall()]
+    conn.close()
+    return [{
+        "bucket_start": r["bucket_start"],
+        "intern_id": r["intern_id_info"],
+        "avg_rating": round(float(r["rating_sum"]) / r["rating_count"], 2) if r["rating_count"] else None,
+        "count": int(r["rating_count"]),
+    } for r in rows]
+
+
+def tasks_trend(period: str):
+    p = ph()
+    conn = connect(readonly=True)
+    cur = conn.cursor()
+    cur.execute(f"""
+      SELECT bucket_start, created, completed, done_hours_sum
+      FROM rollup_tasks WHERE period={p} ORDER BY bucket_start
+    """, (period,))
+    rows = [row_to_dict(r) for r in cur.fetchall()]
+    conn.close()
+    return [{
+        "bucket_start": r["bucket_start"],
+        "created": int(r["created"]),
+        "completed": int(r["completed"]),
+        "avg_hours_to_done": round(float(r["done_hours_sum"]) / r["completed"], 2) if r["completed"] else None,
+    } for r in rows]
+
+
+def time_to_done(period: str):
+    p = ph()
+    conn = connect(readonly=True)
+    cur = conn.cursor()
+    cur.execute(f"""
+      SELECT bucket_start, range_label, count
+      FROM rollup_time_to_done WHERE period={p} ORDER BY bucket_start
+    """, (period,))
+    rows = [row_to_dict(r) for r in cur.fetchall()]
+    conn.close()
+
+    by_bucket, overall = {}, {lbl: 0 for lbl in DONE_LABELS}
+    for r in rows:
+        hist = by_bucket.setdefault(r["bucket_start"], {lbl: 0 for lbl in DONE_LABELS})
+        hist[r["range_label"]] += int(r["count"])
+        overall[r["range_label"]] += int(r["count"])
+    return {
+        "ranges": DONE_LABELS,
+        "overall": overall,
+        "buckets": [{"bucket_start": b, "counts": h} for b, h in sorted(by_bucket.items())],
+    }
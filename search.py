@@ -0,0 +1,121 @@
+import re
+from db import connect, is_postgres, ph, row_to_dict
+
+# Full-text search over interns, tasks and task updates.
+# - SQLite: FTS5 external-content tables kept in sync by triggers
+# - Postgres: GIN expression indexes on to_tsvector(...) (always in sync)
+# The indexes are created by migration 2 (db._m002_search).
+
+SEARCH_KINDS = ("interns", "tasks", "updates")
+
+# Postgres: these expressions must match the indexed ones (db._m002_search) exactly
+PG_VECTORS = {
+    "interns": "to_tsvector('english', coalesce(i.name,'') || ' ' || coalesce(i.learning_skill,'') || ' ' || "
+               "coalesce(i.working_on_project,'') || ' ' || coalesce(i.knowledge_gained,''))",
+    "tasks": "to_tsvector('english', coalesce(t.title,'') || ' ' || coalesce(t.description,''))",
+    "updates": "to_tsvector('english', coalesce(tu.message,''))",
+}
+
+
+def _fts5_query(q: str) -> str:
+    # quote every term so user input can't inject FTS5 syntax; prefix-match each
+    terms = re.findall(r"\w+", q)
+    return " ".join('"' + t + '"*' for t in terms)
+
+
+def _scope(user, kind, p):
+    """Role-based WHERE fragment + params for a search kind."""
+    role = user["role"]
+    if kind == "interns":
+        if role == "intern":
+            return f" AND i.id_info={p}", [user.get("intern_id_info")]
+        return "", []
+    if role == "intern":
+        return f" AND t.assigned_to_user_id={p}", [user["id"]]
+    if role == "supervisor":
+        return f" AND t.assigned_by_user_id={p}", [user["id"]]
+    return "", []
+
+
+def _sqlite_sql(kind, where):
+    if kind == "interns":
+        return f"""
+          SELECT i.id_info, i.name, i.email, i.working_on_project, i.status,
+                 snippet(interns_fts, -1, '[', ']', '...', 12) AS snippet,
+                 bm25(interns_fts) AS score
+          FROM interns_fts JOIN interns i ON i.rowid = interns_fts.rowid
+          WHERE interns_fts MATCH ?{where}
+          ORDER BY score LIMIT ? OFFSET ?
+        """
+    if kind == "tasks":
+        return f"""
+          SELECT t.id, t.title, t.status, t.due_date, t.assigned_to_user_id, t.assigned_by_user_id,
+                 snippet(tasks_fts, -1, '[', ']', '...', 12) AS snippet,
+                 bm25(tasks_fts) AS score
+          FROM tasks_fts JOIN tasks t ON t.id = tasks_fts.rowid
+          WHERE tasks_fts MATCH ?{where}
+          ORDER BY score LIMIT ? OFFSET ?
+        """
+    return f"""
+      SELECT tu.id, tu.task_id, tu.intern_user_id, tu.created_at, t.title AS task_title,
+             snippet(task_updates_fts, -1, '[', ']', '...', 12) AS snippet,
+             bm25(task_updates_fts) AS score
+      FROM task_updates_fts
+      JOIN task_updates tu ON tu.id = task_updates_fts.rowid
+      JOIN tasks t ON t.id = tu.task_id
+      WHERE task_updates_fts MATCH ?{where}
+      ORDER BY score LIMIT ? OFFSET ?
+    """
+
+
+def _pg_sql(kind, where):
+    vec = PG_VECTORS[kind]
+    headline = "StartSel=[, StopSel=], MaxFragments=1, MaxWords=12, MinWords=4"
+    if kind == "interns":
+        return f"""
+          SELECT i.id_info, i.name, i.email, i.working_on_project, i.status,
+                 ts_headline('english', coalesce(i.knowledge_gained,'') || ' ' || coalesce(i.working_on_project,''),
+                             q, '{headline}') AS snippet,
+                 ts_rank({vec}, q) AS score
+          FROM interns i, websearch_to_tsquery('english', %s) q
+          WHERE {vec} @@ q{where}
+          ORDER BY score DESC LIMIT %s OFFSET %s
+        """
+    if kind == "tasks":
+        return f"""
+          SELECT t.id, t.title, t.status, t.due_date, t.assigned_to_user_id, t.assigned_by_user_id,
+                 ts_headline('english', coalesce(t.title,'') || ' ' || coalesce(t.description,''), q, '{headline}') AS snippet,
+                 ts_rank({vec}, q) AS score
+          FROM tasks t, websearch_to_tsquery('english', %s) q
+          WHERE {vec} @@ q{where}
+          ORDER BY score DESC LIMIT %s OFFSET %s
+        """
+    return f"""
+      SELECT tu.id, tu.task_id, tu.intern_user_id, tu.created_at, t.title AS task_title,
+             ts_headline('english', tu.message, q, '{headline}') AS snippet,
+             ts_rank({vec}, q) AS score
+      FROM task_updates tu JOIN tasks t ON t.id = tu.task_id, websearch_to_tsquery('english', %s) q
+      WHERE {vec} @@ q{where}
+      ORDER BY score DESC LIMIT %s OFFSET %s
+    """
+
+
+def search(user, q: str, kinds=SEARCH_KINDS, limit: int = 20, offset: int = 0):
+    """Ranked, paginated hits per kind, filtered by the caller's role."""
+    match = q.strip() if is_postgres() else _fts5_query(q)
+    if not match:
+        return {kind: [] for kind in kinds}
+
+    conn = connect(readonly=True, uid=user["id"])
+    cur = conn.cursor()
+    p = ph()
+
+    out = {}
+    for kind in kinds:
+        where, params = _scope(user, kind, p)
+        sql = _pg_sql(kind, where) if is_postgres() else _sqlite_sql(kind, where)
+        cur.execute(sql, [match, *params, limit, offset])
+        out[kind] = [row_to_dict(r) for r in cur.fetchall()]
+
+    conn.close()
+    return out
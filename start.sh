@@ -1,2 +1,5 @@
 #!/usr/bin/env bash
-uvicorn app:app --host 0.0.0.0 --port ${PORT:-8000}
+# workers: WEB_CONCURRENCY (see gunicorn.conf.py for tuning notes)
+# gunicorn.conf.py turns on the shared live feed (LIVE_SHARED) when workers > 1;
+# for `uvicorn --workers N` export LIVE_SHARED=1 yourself.
+exec gunicorn app:app -c gunicorn.conf.py